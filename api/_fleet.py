@@ -2,28 +2,30 @@ import api.util as u
 from api import Planet
 from api.util import SPEED
 
-class Fleet:
+class Fleet(object):
     """
     An object representing a collection of ships in transit between planets.
 
     """
 
-    # Source planet
-    # NB this is not strictly necessary to remember, but it's good for debugging
-    # and visualization
-    __source = None # type: Planet
+    __slots__ = (
+        # Source planet
+        # NB this is not strictly necessary to remember, but it's good for debugging
+        # and visualization
+        '__source',     # type: Planet
 
-    # Target planet
-    __target = None # type: Planet
+        # Target planet
+        '__target',     # type: Planet
 
-    # Distance to the planet
-    __distance = None # type: int
+        # Distance to the planet
+        '__distance',   # type: int
 
-    # If owner is player 1
-    __ownedBy1 = None # type: bool
+        # If owner is player 1
+        '__ownedBy1',   # type: bool
 
-    # Number of ships in the fleet
-    __size = None # type: int
+        # Number of ships in the fleet
+        '__size'        # type: int
+    )
 
     # Constructor
     def __init__(self,
@@ -127,3 +129,11 @@ class Fleet:
 
     def __hash__(self):
         return hash((self.__source.id(), self.__target.id(), self.__distance, self.__ownedBy1, self.__size))
+
+    # (with __slots__, pickle needs these for its default protocol)
+
+    def __getstate__(self):
+        return self.__source, self.__target, self.__distance, self.__ownedBy1, self.__size
+
+    def __setstate__(self, state):
+        self.__source, self.__target, self.__distance, self.__ownedBy1, self.__size = state
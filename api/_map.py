@@ -1,7 +1,14 @@
 import random
+from fractions import gcd
 
+import api.util as u
 
-class Map:
+
+# How many sets of planets a map keeps for planets_in()
+_MAX_SUBSETS = 4096
+
+
+class Map(object):
     """
     A data object representing the map, ie. the coordinates and sizes of all planets.
     
@@ -9,29 +16,251 @@ class Map:
     does not change throughout the game, as turns are made.
     
     To generate a random map, or load one from a file, see State
+
+    The map also knows when each planet produces ships: a planet with period n (see
+    periods()) produces a ship for its owner at the end of every turn that is a multiple
+    of n. producing() gives the planets that produce in a given turn.
+
+    Moves can be given as pairs (source, target) of planet ids, or encoded as a single
+    integer source * size() + target, with Map.PASS for doing nothing. The map has
+    tables of all moves in both forms, and can convert between them (see encode() and
+    decode()).
     """
 
-    # Planets
-    __planets = None # type: list[Planet]
+    # The encoded move for doing nothing (the move None)
+    PASS = -1
+
+    __slots__ = (
+        # Planets
+        '__planets',        # type: list[Planet]
+
+        # The distance between each pair of planets
+        '__distances',      # type: list[list[float]]
+
+        # How many plies it takes a fleet to travel between each pair of planets
+        '__travel_times',   # type: list[list[int]]
+
+        # For each source planet, all moves from it to another planet: as pairs
+        # (source, target) and encoded as integers
+        '__moves_from',     # type: list[list[tuple[int, int]]]
+        '__encoded_from',   # type: list[list[int]]
+
+        # The pair for each encoded move (the move with code c is __decoded[c])
+        '__decoded',        # type: list[tuple[int, int]]
+
+        # For each planet, how many turns it takes to produce a ship
+        '__periods',        # type: list[int]
+
+        # After this many turns, the planets produce in the same turns again (the lcm of the periods)
+        '__cycle',          # type: int
+
+        # The planets that produce in a turn, by the turn modulo __cycle (filled in as they are asked for)
+        '__producing',      # type: dict[int, tuple[int]]
+
+        # The planets for each bitmask of planets asked for (see planets_in())
+        '__subsets'         # type: dict[int, tuple[Planet]]
+    )
     
-    def __init__(self, planets):
+    def __init__(self, planets, distances=None):
         """
         :param planets: A list of the planets for this map. The list is
             copied and the resultant Map object is not back by the given list.
+        :param distances: Optional. The distances between the planets, if they have been
+            computed before (as in a map catalog). Not copied.
         """
         self.__planets = list(planets)
 
+        # Since the map never changes, we can compute all distances once
+        if distances is None:
+            distances = [[u.distance(source, target) for target in self.__planets] for source in self.__planets]
+
+        self.__distances = distances
+        self.__travel_times = [[int(distance / u.SPEED) for distance in row] for row in self.__distances]
+
+        n = len(self.__planets)
+        self.__decoded = [(source, target) for source in range(n) for target in range(n)]
+        self.__moves_from = [[(source, target) for target in range(n) if target != source] for source in range(n)]
+        self.__encoded_from = [[source * n + target for target in range(n) if target != source] for source in range(n)]
+
+        self.__periods = [planet.turns_per_ship() for planet in self.__planets]
+        self.__cycle = reduce(lambda a, b: a * b // gcd(a, b), self.__periods, 1)
+        self.__producing = {}
+        self.__subsets = {}
+
     def planets(self):
         """
         :return: A list of the planets in this map.
         """
         return self.__planets
     
+    def planets_in(self,
+                   mask     # type: int
+                ):
+        # type: () -> tuple[Planet]
+        """
+        :param mask: A set of planets, as a bitmask: bit i is set for planet i
+        :return: A tuple of the planets in the set, in order. The tuples are kept, so asking for
+            the same set again is cheap.
+        """
+        subset = self.__subsets.get(mask)
+
+        if subset is None:
+            # (with many planets there are too many sets to keep them all)
+            if len(self.__subsets) >= _MAX_SUBSETS:
+                self.__subsets.clear()
+
+            subset = tuple(planet for planet in self.__planets if mask >> planet.id() & 1)
+            self.__subsets[mask] = subset
+
+        return subset
+
     def size(self):
         # type: () -> int
         """
         :return: The number of planets in this map
         """
         return len(self.__planets)
-        
- 
\ No newline at end of file
+
+    def distances(self):
+        # type: () -> list[list[float]]
+        """
+        :return: A matrix (list of lists) of the distances between the planets: distances()[i][j] is
+            the distance from planet i to planet j.
+        """
+        return self.__distances
+
+    def travel_times(self):
+        # type: () -> list[list[int]]
+        """
+        :return: A matrix (list of lists) of travel times: travel_times()[i][j] is the number of
+            plies a fleet takes to get from planet i to planet j.
+        """
+        return self.__travel_times
+
+    def distance(self,
+                 source,    # type: Planet
+                 target     # type: Planet
+                ):
+        # type: () -> float
+        """
+        :return: The (Euclidean) distance between the two given planets.
+        """
+        return self.__distances[source.id()][target.id()]
+
+    def travel_time(self,
+                    source,    # type: Planet
+                    target     # type: Planet
+                ):
+        # type: () -> int
+        """
+        :return: How many plies it takes a fleet to travel from source to target.
+        """
+        return self.__travel_times[source.id()][target.id()]
+
+    def moves_from(self,
+                   source,          # type: int
+                   encoded=False    # type: bool
+                ):
+        # type: () -> list
+        """
+        :param source: The id of a planet
+        :param encoded: Whether to return the moves as integers rather than pairs
+        :return: All moves from the given planet to the other planets. Don't change the list (it's
+            shared), copy it first.
+        """
+        return self.__encoded_from[source] if encoded else self.__moves_from[source]
+
+    def encode(self,
+               move     # type: tuple[int, int]
+            ):
+        # type: () -> int
+        """
+        :param move: A move: a pair (source, target) of planet ids, or None
+        :return: The move as an integer: source * size() + target, or Map.PASS if the move is None.
+        """
+        if move is None:
+            return Map.PASS
+
+        return move[0] * len(self.__planets) + move[1]
+
+    def decode(self,
+               code     # type: int
+            ):
+        # type: () -> tuple[int, int]
+        """
+        :param code: An encoded move (see encode())
+        :return: The move as a pair (source, target) of planet ids, or None if code is Map.PASS.
+        """
+        if code == Map.PASS:
+            return None
+
+        return self.__decoded[code]
+
+    def periods(self):
+        # type: () -> list[int]
+        """
+        :return: For each planet, how many turns it takes to produce a ship (its turns_per_ship()).
+        """
+        return self.__periods
+
+    def producing(self,
+                  turn  # type: int
+                ):
+        # type: () -> tuple[int]
+        """
+        :param turn: A turn number (greater than 0: nothing is produced in turn 0)
+        :return: The ids of the planets that produce a ship at the end of the given turn (if they
+            are owned by a player), in order.
+        """
+        residue = turn % self.__cycle
+
+        if residue not in self.__producing:
+            self.__producing[residue] = tuple(id for id, period in enumerate(self.__periods) if turn % period == 0)
+
+        return self.__producing[residue]
+
+    def production(self,
+                   id,      # type: int
+                   start,   # type: int
+                   end      # type: int
+                ):
+        # type: () -> int
+        """
+        :param id: The id of a planet
+        :return: How many ships the planet produces (if it is owned all that time) at the end of the
+            turns start, start+1, ..., end-1.
+        """
+        period = self.__periods[id]
+        start = max(start, 1)
+
+        if end <= start:
+            return 0
+
+        return (end - 1) // period - (start - 1) // period
+
+    def __eq__(self, other):
+        """
+        Two maps are equal if they have the same planets (positions and sizes) and distances, even
+        if they are different objects (for instance, generated twice, or copied or unpickled).
+        """
+        if self is other:
+            return True
+        if not isinstance(other, Map):
+            return False
+
+        return [(p.coords(), p.size()) for p in self.__planets] == [(p.coords(), p.size()) for p in other.__planets] \
+            and self.__distances == other.__distances
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(tuple((p.coords(), p.size()) for p in self.__planets))
+
+    # (with __slots__, pickle needs these for its default protocol. The tables are computed again.)
+
+    def __getstate__(self):
+        return self.__planets, self.__distances
+
+    def __setstate__(self, state):
+        self.__init__(*state)
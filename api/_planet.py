@@ -1,7 +1,7 @@
 import math
 
 
-class Planet:
+class Planet(object):
     """
     A data object representing a single planet.
 
@@ -9,14 +9,16 @@ class Planet:
     changed as the game is played (ie. ownership and number of ships stationed).
     """
 
-    # The coordinates of the planet
-    __coords = (-1.0, -1.0)
+    __slots__ = (
+        # The coordinates of the planet
+        '__coords', # type: (float, float)
 
-    # The size of the planet
-    __size = -1
+        # The size of the planet
+        '__size',   # type: float
 
-    # The id (the index in the map's planets array)
-    __id = None
+        # The id (the index in the map's planets array)
+        '__id'      # type: int
+    )
 
     def __init__(self,
                  x,     # type: float
@@ -77,3 +79,11 @@ class Planet:
         :return: A compact string representation of this Planet
         """
         return '[{}: s1/{} {}:{}]'.format(self.__id, self.turns_per_ship(), self.__coords[0], self.__coords[1])
+
+    # (with __slots__, pickle needs these for its default protocol)
+
+    def __getstate__(self):
+        return self.__coords, self.__size, self.__id
+
+    def __setstate__(self, state):
+        self.__coords, self.__size, self.__id = state
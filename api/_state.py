@@ -1,43 +1,79 @@
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.axes as axes
-import matplotlib.pyplot as plt
-import api
 import random
-import api.util as u
-import copy
 import math
+import struct
+
+from array import array
 
 from api import Fleet, Planet, Map
 
 
-class State:
+class State(object):
     """
     Represents the state of the game at a given plie.
-    """
-
-    # The map
-    __map = None # type: Map
-
-    # Whether each planet belongs to player 1, 2 or is neutral (player 0)
-    __owner = [] # type: list[int]
 
-    # The number of ships stationed at each planet
-    __garrisons = [] # type: list[int]
-
-    # All fleets in transit
-    __fleets = [] # type: list[Fleet]
-
-    # True if it's player 1's turn
-    __player1s_turn = None # type: bool
-
-    # If one of the players has lost the game by making an illegal move
-    # or not moving fast enough. None is nobody has revoked, otherwise the
-    # id of the player that revoked
-    __revoked = None # type: int, None
+    The volatile parts of the state are stored in flat typed arrays rather than
+    in lists of objects, so that copying a state (which happens at every call to
+    next()) is cheap. The fleets in transit are stored in a timing wheel: they are
+    grouped by the plie in which they arrive, so that a move only needs to look
+    at the fleets that arrive in that plie. The other fleets are not touched, and
+    are shared between a state and its successors. Fleet objects are only created
+    when they are asked for, by fleets().
+    """
 
-    # How many turns have passed
-    __turn = 0 # type: int
+    __slots__ = (
+        # The map
+        '__map',            # type: Map
+
+        # Whether each planet belongs to player 1, 2 or is neutral (player 0)
+        '__owner',          # type: array[int]
+
+        # The number of ships stationed at each planet
+        '__garrisons',      # type: array[int]
+
+        # All fleets in transit, by the plie from which they arrive (ie. the fleets
+        # in __fleets[p] arrive in the move made at plie p). Each fleet is a tuple
+        # (launch, source, target, owner, size, end): the plie at which it was
+        # sent, its source and target planet ids, owner, size, and the plie at
+        # which its distance to the target becomes zero (so that its distance is
+        # end - self.__ply()). The tuples in each bucket are ordered from newest
+        # to oldest. The buckets are never changed, only replaced, so that they
+        # can be shared between states.
+        '__fleets',         # type: dict[int, tuple]
+
+        # True if it's player 1's turn
+        '__player1s_turn',  # type: bool
+
+        # If one of the players has lost the game by making an illegal move
+        # or not moving fast enough. None is nobody has revoked, otherwise the
+        # id of the player that revoked
+        '__revoked',        # type: int, None
+
+        # How many turns have passed
+        '__turn',           # type: int
+
+        # For each player (0, 1 and 2): how many planets they own, how many
+        # fleets they have in transit and how many ships they have in total
+        # (stationed and in transit). These are kept up to date by next(),
+        # so that finished() and winner() don't need to look at every planet.
+        '__planet_count',   # type: list[int]
+        '__fleet_count',    # type: list[int]
+        '__ships',          # type: list[int]
+
+        # For each player (0, 1 and 2): the planets they own, as a bitmask (bit i is
+        # planet i). Kept up to date with the owners, so that planets(owner) can
+        # look up the planets in the map (see Map.planets_in()).
+        '__masks',          # type: list[int]
+
+        # The (Zobrist) hash of the planets and fleets: the sum of the hash keys
+        # of all planets and fleets. None if it hasn't been computed yet. Once
+        # it has, next() keeps it up to date.
+        '__hash',           # type: int, None
+
+        # What happens to the planets if both players pass, until the last fleet has arrived
+        # (see projection()). None if it hasn't been computed yet: it is computed the first
+        # time it's asked for, and thrown away when the state changes.
+        '__projection'      # type: tuple[list[array], list[array]], None
+    )
 
     def __init__(self,
                  map,           # type: Map
@@ -56,14 +92,51 @@ class State:
         :param fleets:      A list of fleet objects representing the fleets in transit in this state
         """
         self.__map = map
-        self.__owner = list(owner)
+        self.__owner = array('b', owner)
 
-        self.__garrisons = list(garrisons)
+        self.__garrisons = array('l', garrisons)
 
         self.__player1s_turn = True if start == 1 else False
 
+        self.__revoked = None
+        self.__turn = 0
+        self.__hash = None
+        self.__projection = None
+
+        self.__fleets = {}
+
         if not fleets is None:
-            self.__fleets = list(fleets)
+            ply = self.__ply()
+
+            # The first fleet in the list is the newest (we pretend they were sent in the plies before this one)
+            for i in range(len(fleets) - 1, -1, -1):
+                fleet = fleets[i]
+                end = ply + fleet.distance()
+
+                self.__add_fleet((ply - 1 - i, fleet.source().id(), fleet.target().id(), fleet.owner(),
+                                  fleet.size(), end), max(end - 1, ply))
+
+        self.__count()
+
+    def __count(self):
+        """
+        Compute the number of planets, fleets and ships of each player from scratch.
+        """
+        self.__planet_count = [self.__owner.count(player) for player in (0, 1, 2)]
+
+        self.__masks = [0, 0, 0]
+        for id, owner in enumerate(self.__owner):
+            self.__masks[owner] |= 1 << id
+        self.__fleet_count = [0, 0, 0]
+
+        self.__ships = [0, 0, 0]
+        for owner, garrison in zip(self.__owner, self.__garrisons):
+            self.__ships[owner] += garrison
+
+        for bucket in self.__fleets.itervalues():
+            for _, _, _, owner, size, _ in bucket:
+                self.__fleet_count[owner] += 1
+                self.__ships[owner] += size
 
     @classmethod
     def make(cls,
@@ -104,7 +177,21 @@ class State:
         """
         :return: A list of the fleet objects in this state
         """
-        return list(self.__fleets)
+        planets = self.__map.planets()
+        ply = self.__ply()
+
+        return [Fleet(planets[source], planets[target], owner, size, end - ply)
+                for _, source, target, owner, size, end in self.__fleet_list()]
+
+    def __fleet_list(self):
+        # type: () -> list[tuple]
+        """
+        :return: The tuples of all fleets in transit, from newest to oldest.
+        """
+        fleets = [fleet for bucket in self.__fleets.itervalues() for fleet in bucket]
+        fleets.sort(reverse=True)
+
+        return fleets
 
     def next(self,
              move   # type: tuple[int, int]
@@ -112,6 +199,7 @@ class State:
         # type: () -> State
         """
         Compute the next state from this one, assuming that the player whose turn it is makes the given move.
+        The move can be a pair (source, target), None, or an encoded move (see Map.encode()).
 
         :return: The state that would result from the given move.
         :raises: RuntimeError if state is finished. Be sure to check state.finished() before calling this
@@ -124,73 +212,431 @@ class State:
         # Start with a copy of the current state
         state = self.clone() # type: State
 
+        state.__step(move, None)
+
+        return state
+
+    def successors(self,
+                   encoded=False    # type: bool
+                ):
+        # type: () -> generator
+        """
+        All the states that can follow this one, one for each legal move. This gives the same
+        pairs as::
+
+            [(move, state.next(move)) for move in state.moves(encoded)]
+
+        but faster. Most of the work in next() doesn't depend on the move: moving the fleets,
+        resolving the fleets that arrive and producing ships. Here, that is done once, for doing
+        nothing. Every other child is a copy of that state, with the new fleet added and the
+        source planet computed again.
+
+        :param encoded: If True, the moves are integers (see Map.encode()), with Map.PASS instead of None.
+        :return: A generator of pairs (move, state), in the order of moves(). The states are new objects.
+        :raises: RuntimeError if state is finished.
+        """
+
+        if self.finished():
+            raise RuntimeError('Gamestate is finished. No next states exist.')
+
+        player = self.whose_turn()
+        turn = self.__turn
+        ply = self.__ply()
+        travel_times = self.__map.travel_times()
+        periods = self.__map.periods()
+
+        # The state after doing nothing
+        base = self.clone() # type: State
+        base.__step(None, None)
+
+        # The fleets that arrive in this plie, for each target planet, in the order __step() handles them
+        arrivals = {}
+        for _, _, target, owner, size, _ in self.__fleets.get(ply, ()):
+            arrivals.setdefault(target, []).append((owner, size))
+
+        for source in range(len(self.__owner)):
+            if self.__owner[source] != player or self.__garrisons[source] <= 1:
+                continue
+
+            garrison = self.__garrisons[source]
+            fleetsize = int(math.floor(float(garrison) * 0.5))
+            produce = player == 2 and turn != 0 and turn % periods[source] == 0
+
+            # What happens at the source planet if nothing is sent (as in base), and if a fleet is sent
+            stay = _resolve(player, garrison, arrivals.get(source, ()), produce)
+            sent = _resolve(player, garrison - fleetsize, arrivals.get(source, ()), produce)
+
+            for move, code in zip(self.__map.moves_from(source), self.__map.moves_from(source, True)):
+                state = base.clone() # type: State
+
+                state.__set_planet(source, sent[0], sent[1], None)
+
+                for owner in (0, 1, 2):
+                    state.__ships[owner] += sent[2][owner] - stay[2][owner]
+
+                state.__planet_count[stay[0]] -= 1
+                state.__planet_count[sent[0]] += 1
+
+                distance = travel_times[source][move[1]]
+                state.__add_fleet((ply, source, move[1], player, fleetsize, ply + 1 + distance), ply + max(distance, 1))
+                state.__fleet_count[player] += 1
+
+                yield (code if encoded else move), state
+
+        yield (Map.PASS if encoded else None), base
+
+    def advance_until_event(self,
+                            max_plies=None  # type: int
+                            ):
+        # type: () -> int
+        """
+        Let both players pass, on this state object itself (like apply()), until the next fleet
+        arrives: the state after that plie is the same as after playing None in every plie. Until
+        a fleet arrives, the only thing that happens is production, and that is added in one go
+        for all these plies, rather than plie by plie.
+
+        If no fleets are in transit, no fleet will arrive, so the state is advanced max_plies plies
+        (or not at all, if max_plies is None).
+
+        :param max_plies: Advance at most this many plies
+        :return: How many plies the state was advanced (0 if it is finished)
+        """
+        if self.finished():
+            return 0
+
+        ply = self.__ply()
+        self.__projection = None
+
+        # The plies in which nothing arrives (the next fleet arrives in plie quiet)
+        if len(self.__fleets) > 0:
+            quiet = min(self.__fleets) - ply
+            if max_plies is not None:
+                quiet = min(quiet, max_plies)
+        else:
+            quiet = 0 if max_plies is None else max_plies
+
+        # Production: the turns in which player 2 passes (and so ends the turn) in the quiet plies
+        if quiet > 0:
+            start = ply // 2
+            end = (ply + quiet) // 2
+
+            for id in range(len(self.__owner)):
+                owner = self.__owner[id]
+                if owner != 0:
+                    produced = self.__map.production(id, start, end)
+
+                    if produced > 0:
+                        self.__set_planet(id, owner, self.__garrisons[id] + produced, None)
+                        self.__ships[owner] += produced
+
+            self.__turn = (ply + quiet) // 2
+            self.__player1s_turn = (ply + quiet) % 2 == 0
+
+        if max_plies is not None and quiet == max_plies or len(self.__fleets) == 0:
+            return quiet
+
+        # The plie in which the fleet arrives
+        self.__step(None, None)
+
+        return quiet + 1
+
+    def apply(self,
+              move  # type: tuple[int, int]
+            ):
+        # type: () -> tuple
+        """
+        Make the given move on this state object itself, rather than on a copy. After this call the
+        state is the same as the state that next(move) would have returned. This allows a search
+        algorithm to walk the game tree with a single state object::
+
+            token = state.apply(move)
+            value = search(state)
+            state.undo(token)
+
+        :return: An undo token. Pass it to undo() to change the state back to how it was before the
+            move. Moves should be undone in the reverse order in which they were applied.
+        :raises: RuntimeError if state is finished.
+        """
+
+        if self.finished():
+            raise RuntimeError('Gamestate is finished. No next states exist.')
+
+        changes = [] # (id, owner, garrison) of each planet before it was changed
+
+        token = (self.__turn, self.__player1s_turn, self.__revoked, changes,
+                 self.__planet_count[:], self.__fleet_count[:], self.__ships[:], self.__masks[:], self.__hash)
+
+        sent, arrived = self.__step(move, changes)
+
+        return token + (sent, arrived)
+
+    def undo(self,
+             token  # type: tuple
+            ):
+        """
+        Take back a move made by apply().
+
+        :param token: The undo token returned by apply()
+        """
+        turn, player1s_turn, revoked, changes, planet_count, fleet_count, ships, masks, zobrist, sent, arrived = token
+
+        if self.__revoked != revoked:
+            # The fleets didn't move
+            self.__shift_fleets(-1)
+
+        # Remove the fleet that was sent (if any, it's the newest in its bucket)
+        if sent is not None:
+            bucket = self.__fleets[sent]
+            if len(bucket) == 1:
+                del self.__fleets[sent]
+            else:
+                self.__fleets[sent] = bucket[1:]
+
+        for id, owner, garrison in reversed(changes):
+            self.__owner[id] = owner
+            self.__garrisons[id] = garrison
+
+        self.__turn = turn
+        self.__player1s_turn = player1s_turn
+        self.__revoked = revoked
+
+        # Put back the fleets that arrived
+        if arrived is not None:
+            self.__fleets[self.__ply()] = arrived
+
+        self.__planet_count = planet_count
+        self.__fleet_count = fleet_count
+        self.__ships = ships
+        self.__masks = masks
+        self.__hash = zobrist
+        self.__projection = None
+
+    def __step(self,
+               move,    # type: tuple[int, int]
+               changes  # type: list
+            ):
+        # type: () -> (int, tuple)
+        """
+        Make the given move on this state, in place. This implements the rules of the game.
+
+        If changes is a list, the old owner and garrison of every planet that changes are added
+        to it, so that the move can be undone.
+
+        :return: The bucket to which the fleet that was sent was added (None if no fleet was sent)
+            and the bucket of fleets that arrived (None if no fleets arrived).
+        """
+        player = self.whose_turn()
+        turn = self.__turn
+        planets = self.planets()
+        ply = self.__ply()
+
+        self.__projection = None
+
+        if isinstance(move, int):
+            move = self.__map.decode(move)
+
         # Switch the player
-        state.__player1s_turn = not self.__player1s_turn
+        self.__player1s_turn = not self.__player1s_turn
 
         # Increment the turn number (we count the number of turns not of plies)
-        if self.whose_turn() == 2:
-            state.__turn += 1
+        if player == 2:
+            self.__turn += 1
 
         # Check illegal moves (moving from other player's planet)
-        if move is not None and self.owner(self.planets()[move[0]]) != self.whose_turn():
-            state.__revoked = self.whose_turn()
-            return state
+        if move is not None and self.__owner[planets[move[0]].id()] != player:
+            self.__revoked = player
+
+            # The fleets stay where they are
+            self.__shift_fleets(1)
+            return None, None
 
-        state.__fleets = []
+        sent = None
 
         # Execute the move
         if move is not None:
 
-            source = self.planets()[move[0]]
-            target = self.planets()[move[1]]
+            source = planets[move[0]]
+            target = planets[move[1]]
+            distance = self.__map.travel_times()[move[0]][move[1]]
 
-            if self.garrison(source) > 1: # If the source planet has < 1 ships, no fleet is sent
+            if self.__garrisons[source.id()] > 1: # If the source planet has < 1 ships, no fleet is sent
 
                 half = float(self.__garrisons[source.id()]) * 0.5
                 fleetsize =  int(math.floor(half))  # add half the ships to the fleet
-                state.__garrisons[source.id()] = self.__garrisons[source.id()] - fleetsize  # leave the rest behind
+                self.__set_planet(source.id(), player, self.__garrisons[source.id()] - fleetsize, changes)  # leave the rest behind
+
+                # It arrives at the earliest in the next plie
+                sent = ply + max(distance, 1)
+                self.__add_fleet((ply, source.id(), target.id(), player, fleetsize, ply + 1 + distance), sent)
+                self.__fleet_count[player] += 1
+
+        # The planets that change owner in this plie, with their previous owner
+        conquered = {}
 
-                fleet = Fleet(source, target, self.whose_turn(), fleetsize)
-                state.__fleets.append(fleet)
+        # Handle the fleets that arrive in this plie, newest first (the other
+        # fleets are not touched).
+        arrived = self.__fleets.pop(ply, None)
 
-        # Move the fleets, and handle attacks
-        for fleet in self.__fleets:
+        if arrived is not None:
+            for fleet in arrived:
+                _, _, target, owner, size, _ = fleet
 
-            next = fleet.next() # New fleet object, one step closer to destination
+                if self.__hash is not None:
+                    self.__hash = (self.__hash - _fleet_key(*fleet[1:])) & _MASK
 
-            if next is None: # fleet has arrived
+                self.__fleet_count[owner] -= 1
 
                 # Reinforcements
-                if state.owner(state.planets()[fleet.target().id()]) == fleet.owner():
-                    state.__garrisons[fleet.target().id()] += fleet.size()
+                if self.__owner[target] == owner:
+                    self.__set_planet(target, owner, self.__garrisons[target] + size, changes)
 
                 # Attack
                 else:
+                    defender = self.__owner[target]
+
                     # compute the ships remaining after attack: negative means attacker won
-                    result = state.__garrisons[fleet.target().id()] - fleet.size()
+                    result = self.__garrisons[target] - size
 
                     # Planet is conquered, change owner
                     if result < 0:
-                        state.__owner[fleet.target().id()] = fleet.owner()
-                        state.__garrisons[fleet.target().id()] = - result
+                        # Both sides lose as many ships as there were stationed at the planet
+                        self.__ships[owner] -= self.__garrisons[target]
+                        self.__ships[defender] -= self.__garrisons[target]
+
+                        self.__planet_count[owner] += 1
+                        self.__planet_count[defender] -= 1
+
+                        conquered.setdefault(target, defender)
+                        self.__set_planet(target, owner, - result, changes)
                     else:
-                        state.__garrisons[fleet.target().id()] = result
-            else:
-                state.__fleets.append(next)
+                        # Both sides lose the whole fleet
+                        self.__ships[owner] -= size
+                        self.__ships[defender] -= size
 
+                        self.__set_planet(target, defender, result, changes)
 
-        state.__player1s_turn = not self.__player1s_turn
+        # If player 2 has moved (end of the turn), increase the garrisons of
+        # the planets that were owned at the start of the plie
+        if player == 2 and turn != 0:
+            for id in self.__map.producing(turn):
+                if conquered.get(id, self.__owner[id]) != 0:
 
-        # If player 2 has moved (end of the turn), increase the garrisons
-        if self.whose_turn() == 2:
-            for planet in self.planets():
+                    self.__set_planet(id, self.__owner[id], self.__garrisons[id] + 1, changes)
+                    self.__ships[self.__owner[id]] += 1
 
-                if self.__turn % planet.turns_per_ship() == 0 \
-                        and self.owner(planet) != 0 \
-                        and self.__turn != 0:
-                    state.__garrisons[planet.id()] += 1
+        return sent, arrived
 
-        return state
+    def __ply(self):
+        # type: () -> int
+        """
+        :return: How many plies preceded this state.
+        """
+        return 2 * self.__turn + (0 if self.__player1s_turn else 1)
+
+    def __set_planet(self, id, owner, garrison, changes):
+        """
+        Change the owner and garrison of the given planet (by id), and update the hash. If changes
+        is a list, the old values are added to it.
+        """
+        if changes is not None:
+            changes.append((id, self.__owner[id], self.__garrisons[id]))
+
+        if self.__hash is not None:
+            self.__hash = (self.__hash - _planet_key(id, self.__owner[id], self.__garrisons[id])
+                           + _planet_key(id, owner, garrison)) & _MASK
+
+        if self.__owner[id] != owner:
+            self.__masks[self.__owner[id]] ^= 1 << id
+            self.__masks[owner] |= 1 << id
+
+        self.__owner[id] = owner
+        self.__garrisons[id] = garrison
+
+    def __add_fleet(self, fleet, arrival):
+        """
+        Add a fleet tuple to the bucket of fleets arriving at the given plie. It must be newer than the
+        fleets already in the bucket.
+        """
+        if self.__hash is not None:
+            self.__hash = (self.__hash + _fleet_key(*fleet[1:])) & _MASK
+
+        self.__fleets[arrival] = (fleet, ) + self.__fleets.get(arrival, ())
+
+    def __shift_fleets(self, plies):
+        """
+        Delay all fleets by the given number of plies (this happens when a player revokes: the
+        fleets don't move).
+        """
+        self.__fleets = {arrival + plies: tuple((launch, source, target, owner, size, end + plies)
+                                                for launch, source, target, owner, size, end in bucket)
+                         for arrival, bucket in self.__fleets.iteritems()}
+
+        # The hash keys of all the fleets have changed, so we recompute the hash if it's asked for
+        self.__hash = None
+
+    def projection(self):
+        # type: () -> tuple[list[array], list[array]]
+        """
+        What will happen to the planets if neither player moves, until the last fleet in transit
+        has arrived::
+
+            owners, garrisons = state.projection()
+            owners[k][i], garrisons[k][i]    # owner and garrison of planet i after k plies
+
+        owners[0] and garrisons[0] are those of this state, and the last entries those after the
+        plie in which the last fleet arrives (after that, only production changes the garrisons,
+        see Map.production()). This is the same as calling next(None) repeatedly, but it is
+        computed in one pass over the fleets, the first time it's asked for. After that it is kept
+        with the state (until it is changed by apply()). Don't change the arrays.
+
+        :return: A pair of lists of arrays: the owners and the garrisons of the planets after each plie.
+        """
+        if self.__projection is None:
+            ply = self.__ply()
+            periods = self.__map.periods()
+
+            owner = self.__owner[:]
+            garrison = self.__garrisons[:]
+
+            owners = [owner[:]]
+            garrisons = [garrison[:]]
+
+            last = max(self.__fleets) if len(self.__fleets) > 0 else ply - 1
+
+            for plie in range(ply, last + 1):
+                turn = plie // 2
+
+                # Production happens at the end of player 2's plies
+                produce = plie % 2 == 1 and turn != 0
+
+                # The fleets that arrive in this plie, for each target (in the order __step() handles them)
+                arrivals = {}
+                for _, _, target, fleet_owner, size, _ in self.__fleets.get(plie, ()):
+                    arrivals.setdefault(target, []).append((fleet_owner, size))
+
+                for id, fleets in arrivals.iteritems():
+                    owner[id], garrison[id], _ = _resolve(owner[id], garrison[id], fleets,
+                                                          produce and turn % periods[id] == 0)
+
+                if produce:
+                    for id in self.__map.producing(turn):
+                        if id not in arrivals and owner[id] != 0:
+                            garrison[id] += 1
+
+                owners.append(owner[:])
+                garrisons.append(garrison[:])
+
+            self.__projection = (owners, garrisons)
+
+        return self.__projection
+
+    def map(self):
+        # type: () -> Map
+        """
+        :return: The map on which this game is played. The map contains the planets, and the
+            distances and travel times between them.
+        """
+        return self.__map
 
     def turn_nr(self):
         # type: () -> int
@@ -214,14 +660,22 @@ class State:
         :param owner_id: Filter by owner. If given, only the planets belonging to
             this owner are returned (0, 1 or 2)
         :return: a list of planets. If no id is given, return all planets. With an
-        id (0, 1 or 2), all planets belonging to that player
+        id (0, 1 or 2), all planets belonging to that player.
         """
-        planets = self.__map.planets()
-
         if owner_id is None:
-            return planets
+            return self.__map.planets()
+
+        # (the map keeps a tuple for each set of planets, the caller gets a list of its own)
+        return list(self.__map.planets_in(self.__masks[owner_id]))
 
-        return [p for p in planets if self.owner(p) == owner_id]
+    def planet_count(self,
+                     owner_id   # type: int
+                    ):
+        # type: () -> int
+        """
+        :return: How many planets the given player (0, 1 or 2) owns. The same as len(planets(owner_id)).
+        """
+        return self.__planet_count[owner_id]
 
     def finished(self):
         # type: () -> bool
@@ -236,17 +690,9 @@ class State:
             return True
 
         for owner in [1, 2]:
-            # If no planets owned
-            if len(self.planets(owner)) == 0:
-
-                # check nr of fleets owned
-                fleets = 0
-                for fleet in self.__fleets:
-                    if fleet.owner() == owner:
-                        fleets += 1
-
-                if fleets == 0:
-                    return True
+            # If no planets and no fleets owned
+            if self.__planet_count[owner] == 0 and self.__fleet_count[owner] == 0:
+                return True
 
         return False
 
@@ -266,13 +712,27 @@ class State:
         if self.__revoked is not None:
             return self.whose_turn()
 
-        if len(self.planets(1)) == 0:
+        if self.__planet_count[1] == 0:
             return 2
 
-        assert(len(self.planets(2)) == 0)
+        assert(self.__planet_count[2] == 0)
 
         return 1
 
+    def ships(self,
+              owner_id = None # type: int
+            ):
+        # type: () -> int
+        """
+        :param owner_id: Filter by owner. If given, only the ships belonging to this owner are
+            counted (0, 1 or 2)
+        :return: The number of ships in this state, both stationed at planets and in fleets.
+        """
+        if owner_id is None:
+            return sum(self.__ships)
+
+        return self.__ships[owner_id]
+
     def owner(self,
               planet # type: Planet
             ):
@@ -297,44 +757,158 @@ class State:
         # type: () -> State
         """
         Creates a copy of this state object, where all the volatile
-        objects (fleets, owner array) are deep-copied. The map and planet are
+        arrays (fleets, owners, garrisons) are copied. The map and planet are
         references to the original objects.
         """
-        state = State(self.__map, list(self.__garrisons), list(self.__owner))
+        state = State.__new__(State)
 
-        state.__revoked = self.__revoked
+        state.__map = self.__map
+        state.__owner = self.__owner[:]
+        state.__garrisons = self.__garrisons[:]
 
-        # Deep copy the fleets
-        fleets = [fleet.clone() for fleet in self.__fleets]
-        state.__fleets = fleets
+        # Copy the timing wheel (the buckets of fleets themselves are shared)
+        state.__fleets = self.__fleets.copy()
 
+        state.__player1s_turn = self.__player1s_turn
+        state.__revoked = self.__revoked
         state.__turn = self.__turn
 
+        state.__planet_count = self.__planet_count[:]
+        state.__fleet_count = self.__fleet_count[:]
+        state.__ships = self.__ships[:]
+        state.__masks = self.__masks[:]
+        state.__hash = self.__hash
+        state.__projection = self.__projection
+
         return state
 
-    def moves(self):
+    def moves(self,
+              encoded=False # type: bool
+            ):
         # type: () -> list[tuple[int, int]]
         """
+        :param encoded: If True, the moves are returned as integers (see Map.encode()), with
+            Map.PASS instead of None.
         :return: A list of all the legal moves that can be made by the player whose turn it is.
         """
-        # get the planets
-        mine = self.planets(self.whose_turn())
-        all = self.planets()
+        player = self.whose_turn()
+        owner = self.__owner
+        garrisons = self.__garrisons
 
-        # Generate all possible pairs with the first element from mine
-        # and the second from all.
+        # All pairs with the first element from the planets we can send ships
+        # from, and the second from all other planets (these are stored in the map).
         moves = []
-        for m in mine:
-            if self.garrison(m) > 1:
-                for a in all:
-                    if m.id() != a.id():
-                        moves.append((m.id(),a.id()))
+        for planet in self.__map.planets():
+            id = planet.id()
+            if owner[id] == player and garrisons[id] > 1:
+                moves.extend(self.__map.moves_from(id, encoded))
 
         # None is also a legal move (do nothing)
-        moves.append(None)
+        moves.append(Map.PASS if encoded else None)
 
         return moves
 
+    def playout(self,
+                policy='random',    # type: str | function
+                max_plies=None,     # type: int
+                rng=random          # type: random.Random
+            ):
+        # type: () -> State
+        """
+        Play the game on from this state, with both players following the given policy. The moves
+        are made in place, on a single copy of this state, so this is much faster than calling
+        next() in a loop::
+
+            end = state.playout('random', 10)
+            value = util.ratio_ships(end, 1)
+
+        :param policy: How to choose the moves: 'random' (every legal move is equally likely,
+            like the rand bot), 'bully' (like the bully bot), 'pass' (never move: this skips ahead
+            from one fleet arrival to the next, see advance_until_event()), or a function that takes
+            a state and returns a move (like the get_move method of a bot). The built-in policies
+            don't create lists of moves.
+        :param max_plies: The maximum number of plies to play. If None, play until the game is finished.
+        :param rng: The random number generator for the 'random' policy.
+        :return: The state at the end of the playout (a new object: this state is not changed).
+        """
+        state = self.clone()
+
+        if policy == 'pass':
+            plies = 0
+            while not state.finished() and (max_plies is None or plies < max_plies):
+                advanced = state.advance_until_event(None if max_plies is None else max_plies - plies)
+                if advanced == 0:
+                    break
+
+                plies += advanced
+
+            return state
+
+        if policy == 'random':
+            choose = lambda: state.__random_move(rng)
+        elif policy == 'bully':
+            choose = lambda: state.__bully_move()
+        else:
+            choose = lambda: policy(state)
+
+        plies = 0
+        while not state.finished() and (max_plies is None or plies < max_plies):
+            state.__step(choose(), None)
+            plies += 1
+
+        return state
+
+    def __random_move(self, rng):
+        # type: (random.Random) -> tuple[int, int]
+        """
+        :return: A random legal move (the same as rng.choice(self.moves()), but without creating the list)
+        """
+        player = self.whose_turn()
+        owner = self.__owner
+        garrisons = self.__garrisons
+
+        sources = [p.id() for p in self.__map.planets() if owner[p.id()] == player and garrisons[p.id()] > 1]
+
+        # The moves from each source planet, and None
+        n = self.__map.size() - 1
+        index = rng.randrange(len(sources) * n + 1)
+
+        if index == len(sources) * n:
+            return None
+
+        return self.__map.moves_from(sources[index // n])[index % n]
+
+    def __bully_move(self):
+        # type: () -> tuple[int, int]
+        """
+        :return: The move the bully bot would make: from our strongest planet to the weakest planet
+            we don't own.
+        """
+        player = self.whose_turn()
+        opponent = 1 if player == 2 else 2
+        owner = self.__owner
+        garrisons = self.__garrisons
+        planets = self.__map.planets()
+
+        source = None
+        for planet in planets:
+            id = planet.id()
+            if owner[id] == player and garrisons[id] > 1 and (source is None or garrisons[id] > garrisons[source]):
+                source = id
+
+        # The opponent's planets are preferred over neutral ones with the same garrison
+        target = None
+        for other in (opponent, 0):
+            for planet in planets:
+                id = planet.id()
+                if owner[id] == other and (target is None or garrisons[id] < garrisons[target]):
+                    target = id
+
+        if source is None or target is None:
+            return None
+
+        return source, target
+
     def visualize(self):
         # type: () -> Figure
         """
@@ -344,73 +918,143 @@ class State:
             state.visualize().savefig('filename.png')
 
             The format is automatically determined from the extension you choose.
+
+            To draw many states (for instance all states of a game), use a single api.renderer.Renderer,
+            which reuses its figure.
+        """
+        # (matplotlib is only loaded when it's needed)
+        from api.renderer import Renderer
+
+        return Renderer().render(self)
+
+    def to_bytes(self):
+        # type: () -> str
+        """
+        Encode this state as a compact string of bytes, for sending it to another process. Only the
+        parts that change during the game are included (owners, garrisons, fleets and turn), not
+        the map: the receiver should already have it. Decode with State.from_bytes(map, data).
+
+        :return: A string of bytes
+        """
+        n = len(self.__owner)
+        fleets = self.__fleet_list()
+
+        data = [struct.pack(_WIRE_HEADER, _WIRE_MAGIC, _WIRE_VERSION, self.__player1s_turn,
+                            self.__revoked or 0, self.__turn, n, len(fleets)),
+                self.__owner.tostring(),
+                struct.pack('<{}i'.format(n), *self.__garrisons)]
+
+        for fleet in fleets:
+            data.append(struct.pack(_WIRE_FLEET, *fleet))
+
+        return b''.join(data)
+
+    @staticmethod
+    def from_bytes(map, data):
+        # type: (Map, str) -> State
+        """
+        Decode a state encoded by to_bytes().
+
+        :param map: The map of the state
+        :param data: A string of bytes returned by to_bytes()
+        :return: A state equal to the one that was encoded
+        :raises: ValueError if the data isn't a state (of this version), or the state is for a map with
+            a different number of planets.
         """
-        fig = plt.figure(figsize=(6,6))
-        cm = ['gray', 'blue', 'red']
+        header = struct.calcsize(_WIRE_HEADER)
+        if len(data) < header:
+            raise ValueError('Not an encoded state (too short).')
+
+        magic, version, player1s_turn, revoked, turn, n, num_fleets = struct.unpack_from(_WIRE_HEADER, data)
 
-        ax = fig.add_subplot(111) # type: axes.Axes
-        ax.set_axis_bgcolor('#19102b')
+        if magic != _WIRE_MAGIC:
+            raise ValueError('Not an encoded state.')
+        if version != _WIRE_VERSION:
+            raise ValueError('Encoded state has version {}, expected {}.'.format(version, _WIRE_VERSION))
+        if n != map.size():
+            raise ValueError('Encoded state has {} planets, but the map has {}.'.format(n, map.size()))
 
-        # Plot the planets
-        xs = []
-        ys = []
-        sizes = []
-        labels = []
+        state = State.__new__(State)
 
-        for planet in self.planets():
-            xs.append(planet.coords()[0])
-            ys.append(planet.coords()[1])
-            sizes.append(planet.size() * 500)
-            labels.append(self.garrison(planet))
+        state.__map = map
+        state.__owner = array('b', data[header:header + n])
+        state.__garrisons = array('l', struct.unpack_from('<{}i'.format(n), data, header + n))
 
-        ax.scatter(xs, ys, s=sizes, c=[cm[o] for o in self.__owner], zorder=10, linewidth=0,)
+        state.__player1s_turn = bool(player1s_turn)
+        state.__revoked = revoked if revoked != 0 else None
+        state.__turn = turn
+        state.__hash = None
+        state.__projection = None
 
-        for x, y, label, size in zip(xs, ys, labels, sizes):
-            ax.annotate(
-                label,
-                xy=(x, y), xytext=(0, - 15 - size/50.0),
-                textcoords='offset points', ha='center', va='bottom',
-                zorder=30, color='white')
+        state.__fleets = {}
 
-        # Plot the fleets
-        for fleet in self.__fleets:
-            ax.plot(
-                [fleet.source().coords()[0],
-                 fleet.target().coords()[0]],
-                [fleet.source().coords()[1],
-                 fleet.target().coords()[1]], alpha=0.8, color=cm[fleet.owner()], linestyle='dotted')
+        # The fleets are stored newest first, so we add them in reverse
+        ply = state.__ply()
+        start = header + 5 * n
+        size = struct.calcsize(_WIRE_FLEET)
 
-            turns_left = fleet.distance()
-            max_dist = api.util.distance(fleet.source(), fleet.target())
-            max_turns = max_dist / u.SPEED
+        for i in range(num_fleets - 1, -1, -1):
+            fleet = struct.unpack_from(_WIRE_FLEET, data, start + i * size)
+            state.__add_fleet(fleet, max(fleet[5] - 1, ply))
 
-            ratio = 0.5 if max_turns == 0 else float(turns_left) / float(max_turns) # scale the distance travelled to target to the range (0, 1)
+        state.__count()
 
-            # Current location of the fleet
-            location = plus(mult(fleet.source().coords(), ratio), mult(fleet.target().coords(), 1.0 - ratio))
+        return state
+
+    def __hash__(self):
+        # type: () -> int
+        """
+        States that are the same have the same hash, even if they were reached by different
+        moves. This allows search algorithms to store information about states in a dictionary or
+        transposition table.
+
+        The hash is computed the first time it is asked for. After that, next() and apply()
+        update it as planets and fleets change, rather than recomputing it.
+        """
+        if self.__hash is None:
+            _extend_keys(len(self.__owner))
+
+            hash = 0
+            for id, (owner, garrison) in enumerate(zip(self.__owner, self.__garrisons)):
+                hash += _planet_key(id, owner, garrison)
+
+            for bucket in self.__fleets.itervalues():
+                for fleet in bucket:
+                    hash += _fleet_key(*fleet[1:])
 
-            ax.scatter(location[0], location[1], c=cm[fleet.owner()], s=math.sqrt(fleet.size()) * 20, marker='s', linewidth=0, zorder=20)
+            self.__hash = hash & _MASK
 
-            ax.annotate(
-                fleet.size(),
-                xy=location, xytext=(0, - 20),
-                textcoords='offset points', ha='center', va='bottom',
-                zorder=30, color=cm[fleet.owner()])
+        return self.__hash ^ _mix((self.__ply() << 2) + (0 if self.__revoked is None else self.__revoked))
 
-        ax.spines["right"].set_visible(False)
-        ax.spines["top"].set_visible(False)
-        ax.spines["bottom"].set_visible(False)
-        ax.spines["left"].set_visible(False)
+    def __eq__(self, other):
+        """
+        Two states are equal if they are played on the same map and the same plie, and all
+        planets and fleets are the same. The maps are compared by their planets (see Map.__eq__),
+        so a state equals its copies, even if they have their own map object.
+        """
+        if not isinstance(other, State):
+            return False
 
-        ax.get_xaxis().set_tick_params(which='both', top='off', bottom='off', labelbottom='off')
-        ax.get_yaxis().set_tick_params(which='both', left='off', right='off', labelleft='off')
+        return self.__ply() == other.__ply() \
+            and self.__revoked == other.__revoked \
+            and self.__owner == other.__owner \
+            and self.__garrisons == other.__garrisons \
+            and [fleet[1:] for fleet in self.__fleet_list()] == [fleet[1:] for fleet in other.__fleet_list()] \
+            and self.__map == other.__map
 
-#        ax.set_xlim([0, 1])
-#        ax.set_ylim([0, 1])
+    def __ne__(self, other):
+        return not self.__eq__(other)
 
-        ax.set_title('turn {}.{}: '.format(self.__turn, self.whose_turn()))
+    # (with __slots__, pickle needs these for its default protocol. The projection is not kept.)
 
-        return fig
+    def __getstate__(self):
+        return (self.__map, self.__owner, self.__garrisons, self.__fleets, self.__player1s_turn, self.__revoked,
+                self.__turn, self.__planet_count, self.__fleet_count, self.__ships, self.__masks, self.__hash)
+
+    def __setstate__(self, state):
+        (self.__map, self.__owner, self.__garrisons, self.__fleets, self.__player1s_turn, self.__revoked,
+         self.__turn, self.__planet_count, self.__fleet_count, self.__ships, self.__masks, self.__hash) = state
+        self.__projection = None
 
     def __repr__(self):
         # type: () -> str
@@ -437,7 +1081,7 @@ class State:
         return res
 
     @staticmethod
-    def generate(num_planets, id=None, symmetric=True):
+    def generate(num_planets, id=None, symmetric=True, catalog=None):
         # type: () -> (State, id)
         """
         Generates a random start state: a random map, with home planets assigned
@@ -448,10 +1092,19 @@ class State:
         :param num_planets: The number of planets in the map
         :param id: Optional. The same id will always lead to the same map. If it is not
             supplied, or None, a random map will be generated.
+        :param catalog: Optional. A MapCatalog (see api.catalog) to read the map from, if it
+            has it. Without an id, a random map from the catalog is chosen.
 
         :return: A pair of a starting state and its id.
         """
 
+        if catalog is not None:
+            if id is None and len(catalog.ids(num_planets)) > 0:
+                id = random.choice(catalog.ids(num_planets))
+
+            if id is not None and catalog.contains(num_planets, id, symmetric):
+                return catalog.state(num_planets, id), id
+
         if not symmetric:
             return State.generate_asym(num_planets, id)
 
@@ -469,8 +1122,8 @@ class State:
 
         garrisons = [100, 100]
 
-        # Rest of the planets
-        for i in range(2, num_planets, 2):
+        # Rest of the planets (the last one is placed below if the number is odd)
+        for i in range(2, num_planets - 1, 2):
             x = round(rng.random(), 2)
             y = round(rng.random(), 2)
             size = 1.0 / rng.choice([1] + [3, 5, 7, 13, 17] * 3)
@@ -525,7 +1178,7 @@ class State:
         return state, id
 
     @staticmethod
-    def load(file, whose_turn=1):
+    def load(file, whose_turn=1, index=0):
         # type: () -> State
         """
         Loads a state from a file (or more accurately, a map, and garrison/ownership information).
@@ -535,32 +1188,140 @@ class State:
         At least one planet should be owned by player 1 and one by 2.
 
         For instance:
-            0.0, 0.0, 10, 50, 1
-            1.0, 1.0, 10, 50, 2
-            0.5, 0.5, 1, 30, 0
+            0.0, 0.0, 1, 50, 1
+            1.0, 1.0, 1, 50, 2
+            0.5, 0.5, 0.2, 30, 0
+
+        A file can have several maps, separated by empty lines. Lines starting with # are ignored.
+
+        :param index: Which map in the file to load (see load_all() to load them all)
         """
+        return State.load_all(file, whose_turn)[index]
+
+    @staticmethod
+    def load_all(file, whose_turn=1):
+        # type: () -> list[State]
+        """
+        Loads all the states in a file with several maps (see load()).
+
+        :return: A list of states, one for each map in the file, in order.
+        """
+        states = []
 
         planets = []
         garrisons = []
         owners = []
 
         with open(file, 'r') as f:
-            for line in f:
-                line = line.rstrip()
+            for line in list(f) + ['']:
+                line = line.strip()
+
+                if line.startswith('#'):
+                    continue
+
+                if line == '':
+                    # The end of a map
+                    if len(planets) > 0:
+                        states.append(State(Map(planets), garrisons, owners, whose_turn))
+
+                    planets = []
+                    garrisons = []
+                    owners = []
+                    continue
+
                 x, y, size, nr_ships, owner = line.split(',')
 
                 x = float(x)
                 y = float(y)
-                size = int(size)
+                size = float(size)
                 nr_ships = int(nr_ships)
                 owner = int(owner)
 
-                planets.append(Planet(x, y, size))
+                planets.append(Planet(x, y, size, len(planets)))
                 garrisons.append(nr_ships)
                 owners.append(owner)
 
-        map = Map(planets)
-        state = State(map, garrisons, owners, whose_turn)
+        return states
+
+def _resolve(owner, garrison, arrivals, produce):
+    """
+    What happens to a single planet in a plie: the fleets that arrive (a list of (owner, size),
+    in order), and then production.
+
+    :return: The owner and garrison of the planet at the end of the plie, and the change in the
+        number of ships of each player (a list of three numbers).
+    """
+    start = owner
+    ships = [0, 0, 0]
+
+    for attacker, size in arrivals:
+        if attacker == owner:
+            garrison += size
+        elif garrison - size < 0:
+            ships[attacker] -= garrison
+            ships[owner] -= garrison
+            owner, garrison = attacker, size - garrison
+        else:
+            ships[attacker] -= size
+            ships[owner] -= size
+            garrison -= size
+
+    # A planet produces if it was owned at the start of the plie
+    if produce and start != 0:
+        garrison += 1
+        ships[owner] += 1
+
+    return owner, garrison, ships
+
+# Hash keys. The hash of a state is the sum (modulo 2^64) of the keys of its
+# planets and fleets. The key of a planet is a + b * garrison, for two random
+# numbers a and b that depend on the planet and its owner, so that a planet
+# producing a ship changes the hash by just b. The plie at which a fleet arrives
+# is part of its key (rather than its distance), so that the key doesn't change
+# as the fleet moves.
+
+_MASK = (1 << 64) - 1
+
+# The random numbers (a, b) for the key of planet id with owner o are at index 3 * id + o
+_PLANET_KEYS = [] # type: list[tuple[int, int]]
+_KEY_RNG = random.Random(1)
+
+def _extend_keys(num_planets):
+    # type: (int) -> None
+    """
+    Make sure there are planet keys for the given number of planets.
+    """
+    while len(_PLANET_KEYS) < 3 * num_planets:
+        _PLANET_KEYS.append((_KEY_RNG.getrandbits(64), _KEY_RNG.getrandbits(64) | 1))
+
+def _planet_key(id, owner, garrison):
+    # type: (int, int, int) -> int
+    a, b = _PLANET_KEYS[3 * id + owner]
+    return a + b * garrison
+
+def _mix(x):
+    # type: (int) -> int
+    """
+    Scramble an integer into a 64 bit hash key (a multiplicative hash).
+    """
+    x = (x * 0x9e3779b97f4a7c15) & _MASK
+    return x ^ (x >> 29)
+
+def _fleet_key(source, target, owner, size, end):
+    # type: (int, int, int, int, int) -> int
+    return _mix(_mix((source << 34) + (target << 2) + owner) ^ ((size << 32) + end))
+
+# The binary encoding of states (see State.to_bytes()). A header with the turn and the
+# sizes, followed by the owner of each planet (a byte), the garrison of each planet
+# (4 bytes), and the fleets (newest first). Increment the version if the format changes.
+_WIRE_MAGIC = b'PW'
+_WIRE_VERSION = 1
+
+# magic, version, player 1's turn, revoked, turn, number of planets, number of fleets
+_WIRE_HEADER = '<2sBBbiHH'
+
+# launch, source, target, owner, size, end
+_WIRE_FLEET = '<iHHbii'
 
 def mult(
         seq,    # type: list[float]
@@ -0,0 +1,357 @@
+"""
+Play many games at the same time, using numpy.
+
+A BatchState holds a number of game states (the rows of the batch) in 2D numpy
+arrays: one row per state and one column per planet. All states are on the same
+map, and at the same plie. Each call to apply() makes one move in every state at
+once, using vectorized operations. This makes it very fast to play out many
+random games, for instance to estimate the value of a state::
+
+    batch = BatchState([state] * 1000)
+    batch.playout(max_plies=10)
+    value = batch.ratio_ships(1).mean()
+
+The rules are exactly the same as in State.next() (check_batch.py checks this).
+"""
+
+import numpy as np
+
+
+class BatchState(object):
+    """
+    A batch of game states, played simultaneously.
+
+    Once the game in a row is finished, that row doesn't change anymore.
+    """
+
+    __slots__ = (
+        # The map (shared by all rows)
+        '__map',            # type: Map
+
+        # How many turns have passed, and whose turn it is (shared by all rows)
+        '__turn',           # type: int
+        '__player1s_turn',  # type: bool
+
+        # Owner and garrison of every planet: K by N arrays (for K rows and N planets)
+        '__owner',          # type: np.ndarray
+        '__garrisons',      # type: np.ndarray
+
+        # The fleets in transit: K by W arrays. Each column is a slot for one fleet,
+        # and a fleet sent at plie p goes in slot p % W (there is at most one
+        # fleet sent per plie). Empty slots have owner 0 and size 0. The end of a
+        # fleet is the plie at which its distance becomes zero (as in State).
+        '__fleet_target',   # type: np.ndarray
+        '__fleet_owner',    # type: np.ndarray
+        '__fleet_size',     # type: np.ndarray
+        '__fleet_end',      # type: np.ndarray
+
+        # For each row, the winner of the game (1 or 2), or 0 if it's not finished
+        '__winner',         # type: np.ndarray
+
+        # Travel time between every pair of planets (N by N)
+        '__travel_times',   # type: np.ndarray
+
+        # How many turns each planet needs to produce a ship
+        '__periods'         # type: np.ndarray
+    )
+
+    def __init__(self,
+                 states  # type: list[State]
+                ):
+        """
+        :param states: The states to put in the batch, one per row. All states must be on the same
+            map and at the same plie. The states themselves are not changed.
+        """
+        states = list(states)
+
+        if len(states) == 0:
+            raise ValueError('A batch needs at least one state.')
+
+        first = states[0]
+        for state in states:
+            if state.map() is not first.map() \
+                    or state.turn_nr() != first.turn_nr() \
+                    or state.whose_turn() != first.whose_turn():
+                raise ValueError('All states in a batch should be on the same map and at the same plie.')
+
+        self.__map = first.map()
+        self.__turn = first.turn_nr()
+        self.__player1s_turn = first.whose_turn() == 1
+
+        planets = self.__map.planets()
+
+        self.__owner = np.array([[state.owner(p) for p in planets] for state in states], dtype=np.int8)
+        self.__garrisons = np.array([[state.garrison(p) for p in planets] for state in states], dtype=np.int64)
+
+        self.__travel_times = np.array(self.__map.travel_times(), dtype=np.int64)
+        self.__periods = np.array(self.__map.periods(), dtype=np.int64)
+
+        # The fleets we are given are put in the slots before the current plie, newest first.
+        # We need enough slots that a fleet has always arrived before its slot is used again.
+        ply = self.__ply()
+        fleets = [state.fleets() for state in states]
+
+        width = self.__travel_times.max() if len(planets) > 0 else 0
+        for row in fleets:
+            for i, fleet in enumerate(row):
+                width = max(width, max(fleet.distance(), 1) + i)
+        width += 1
+
+        self.__fleet_target = np.zeros((len(states), width), dtype=np.int64)
+        self.__fleet_owner = np.zeros((len(states), width), dtype=np.int8)
+        self.__fleet_size = np.zeros((len(states), width), dtype=np.int64)
+        self.__fleet_end = np.zeros((len(states), width), dtype=np.int64)
+
+        for r, row in enumerate(fleets):
+            for i, fleet in enumerate(row):
+                slot = (ply - 1 - i) % width
+                self.__fleet_target[r, slot] = fleet.target().id()
+                self.__fleet_owner[r, slot] = fleet.owner()
+                self.__fleet_size[r, slot] = fleet.size()
+                self.__fleet_end[r, slot] = ply + fleet.distance()
+
+        self.__winner = np.array([state.winner() if state.finished() else 0 for state in states], dtype=np.int8)
+
+    def size(self):
+        # type: () -> int
+        """
+        :return: The number of states (rows) in this batch
+        """
+        return len(self.__winner)
+
+    def turn_nr(self):
+        # type: () -> int
+        """
+        :return: How many turns preceded the states in this batch.
+        """
+        return self.__turn
+
+    def whose_turn(self):
+        # type: () -> int
+        """
+        :return: The player who is set to make the next move (the same in every row).
+        """
+        return 1 if self.__player1s_turn else 2
+
+    def finished(self):
+        # type: () -> np.ndarray
+        """
+        :return: A boolean array, indicating for each row whether its game is finished.
+        """
+        return self.__winner != 0
+
+    def winner(self):
+        # type: () -> np.ndarray
+        """
+        :return: An integer array with, for each row, the player who won (1 or 2), or 0 if its
+            game is not finished.
+        """
+        return self.__winner.copy()
+
+    def owners(self):
+        # type: () -> np.ndarray
+        """
+        :return: The owner of every planet: a K by N integer array (for K rows and N planets).
+        """
+        return self.__owner.copy()
+
+    def garrisons(self):
+        # type: () -> np.ndarray
+        """
+        :return: The garrison of every planet: a K by N integer array (for K rows and N planets).
+        """
+        return self.__garrisons.copy()
+
+    def fleets(self,
+               row  # type: int
+            ):
+        # type: () -> list[tuple[int, int, int, int]]
+        """
+        :return: The fleets in transit in the given row, as tuples (target, owner, size, distance),
+            sorted. The distance is as in Fleet.distance().
+        """
+        ply = self.__ply()
+        slots = np.flatnonzero(self.__fleet_owner[row] != 0)
+
+        return sorted((int(self.__fleet_target[row, slot]), int(self.__fleet_owner[row, slot]),
+                       int(self.__fleet_size[row, slot]), int(self.__fleet_end[row, slot]) - ply) for slot in slots)
+
+    def ships(self,
+              owner_id  # type: int
+            ):
+        # type: () -> np.ndarray
+        """
+        :return: For each row, the number of ships (on planets and in fleets) of the given player.
+        """
+        return (self.__garrisons * (self.__owner == owner_id)).sum(axis=1) \
+            + (self.__fleet_size * (self.__fleet_owner == owner_id)).sum(axis=1)
+
+    def ratio_ships(self,
+                    owner_id  # type: int
+                ):
+        # type: () -> np.ndarray
+        """
+        :return: For each row, the ratio of the number of ships belonging to given player to the
+            total (as in util.ratio_ships)
+        """
+        total = self.__garrisons.sum(axis=1) + self.__fleet_size.sum(axis=1)
+        return self.ships(owner_id) / total.astype(np.float64)
+
+    def random_moves(self,
+                     rng=None   # type: np.random.RandomState
+                    ):
+        # type: () -> (np.ndarray, np.ndarray)
+        """
+        Choose a random legal move in each row. Every move in state.moves() (including doing nothing)
+        is equally likely.
+
+        :param rng: The random number generator to use (the numpy default if None)
+        :return: Two integer arrays: the source and destination planet of the move in each row. Both
+            are -1 for rows where the move is None.
+        """
+        rng = np.random if rng is None else rng
+        n = max(self.__map.size() - 1, 1) # the number of destinations per source
+
+        # The planets we can send fleets from
+        sources = (self.__owner == self.whose_turn()) & (self.__garrisons > 1)
+
+        # Choose the index of a move in the list returned by State.moves(): n moves per source,
+        # and None at the end
+        num_moves = sources.sum(axis=1) * n + 1
+        index = np.minimum((rng.random_sample(self.size()) * num_moves).astype(np.int64), num_moves - 1)
+
+        # Find the source (the index // n-th planet we can send from) and the destination (the
+        # index % n-th planet, skipping the source)
+        source = np.argmax(np.cumsum(sources, axis=1) > (index // n)[:, None], axis=1)
+        target = index % n
+        target += (target >= source)
+
+        passing = index == num_moves - 1
+
+        return np.where(passing, -1, source), np.where(passing, -1, target)
+
+    def apply(self,
+              sources,  # type: np.ndarray
+              targets   # type: np.ndarray
+            ):
+        """
+        Make a move in every row (in place). Rows whose game is finished are not changed.
+
+        :param sources: The source planet of the move in each row, or -1 for no move.
+        :param targets: The destination planet of the move in each row, or -1 for no move.
+        """
+        player = self.whose_turn()
+        ply = self.__ply()
+        width = self.__fleet_owner.shape[1]
+        rows = np.arange(self.size())
+
+        sources = np.asarray(sources)
+        targets = np.asarray(targets)
+
+        active = self.__winner == 0
+        moving = active & (sources >= 0)
+        sources = np.where(moving, sources, 0)
+        targets = np.where(moving, targets, 0)
+
+        # Moving from another player's planet is illegal: the player loses the game
+        revoked = moving & (self.__owner[rows, sources] != player)
+        active &= ~ revoked
+        moving &= ~ revoked
+
+        # Send half the ships from the source planet, if it has more than one
+        garrison = self.__garrisons[rows, sources]
+        launching = moving & (garrison > 1)
+        fleetsize = garrison // 2
+
+        self.__garrisons[rows[launching], sources[launching]] -= fleetsize[launching]
+
+        # At the end of the turn, planets produce ships (if they were owned at the start of the plie)
+        producing = None
+        if player == 2 and self.__turn != 0:
+            producing = ((self.__turn % self.__periods) == 0) & (self.__owner != 0) & active[:, None]
+
+        # Fleets arrive, newest fleets first
+        for age in range(1, width + 1):
+            slot = (ply - age) % width
+
+            arriving = active & (self.__fleet_owner[:, slot] != 0) & (self.__fleet_end[:, slot] <= ply + 1)
+            if not arriving.any():
+                continue
+
+            r = rows[arriving]
+            target = self.__fleet_target[r, slot]
+            owner = self.__fleet_owner[r, slot]
+            size = self.__fleet_size[r, slot]
+
+            defender = self.__owner[r, target]
+            garrison = self.__garrisons[r, target]
+
+            # Reinforce, or attack (negative means the attacker won)
+            result = np.where(defender == owner, garrison + size, garrison - size)
+
+            self.__owner[r, target] = np.where(result < 0, owner, defender)
+            self.__garrisons[r, target] = np.abs(result)
+
+            self.__fleet_owner[r, slot] = 0
+            self.__fleet_size[r, slot] = 0
+
+        # Put the new fleets in their slot (now that the fleet that was in it has arrived)
+        slot = ply % width
+        r = rows[launching]
+        self.__fleet_target[r, slot] = targets[launching]
+        self.__fleet_owner[r, slot] = player
+        self.__fleet_size[r, slot] = fleetsize[launching]
+        self.__fleet_end[r, slot] = ply + 1 + self.__travel_times[sources[launching], targets[launching]]
+
+        if producing is not None:
+            self.__garrisons += producing
+
+        # Switch the player, and increment the turn number after player 2 has moved
+        if player == 2:
+            self.__turn += 1
+        self.__player1s_turn = not self.__player1s_turn
+
+        # Check which games are finished
+        self.__winner[revoked] = 1 if player == 2 else 2
+
+        has_planets1 = (self.__owner == 1).any(axis=1)
+        has_planets2 = (self.__owner == 2).any(axis=1)
+        has_fleets1 = (self.__fleet_owner == 1).any(axis=1)
+        has_fleets2 = (self.__fleet_owner == 2).any(axis=1)
+
+        done = active & ~ ((has_planets1 | has_fleets1) & (has_planets2 | has_fleets2))
+        self.__winner[done] = np.where(has_planets1[done], 1, 2)
+
+    def apply_random(self,
+                     rng=None   # type: np.random.RandomState
+                    ):
+        """
+        Make a random legal move in every row (in place).
+
+        :param rng: The random number generator to use (the numpy default if None)
+        """
+        sources, targets = self.random_moves(rng)
+        self.apply(sources, targets)
+
+    def playout(self,
+                max_plies=None, # type: int
+                rng=None        # type: np.random.RandomState
+            ):
+        """
+        Play random moves in every row, until all games are finished or the given number of plies
+        has been played.
+
+        :param max_plies: The maximum number of plies to play. If None, play until all games are finished.
+        :param rng: The random number generator to use (the numpy default if None)
+        """
+        plies = 0
+        while not self.finished().all() and (max_plies is None or plies < max_plies):
+            self.apply_random(rng)
+            plies += 1
+
+    def __ply(self):
+        # type: () -> int
+        """
+        :return: How many plies preceded the states in this batch.
+        """
+        return 2 * self.__turn + (0 if self.__player1s_turn else 1)
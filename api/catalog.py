@@ -0,0 +1,217 @@
+"""
+Map catalogs: files of pre-generated start states, that can be shared by many processes.
+
+Generating a start state (State.generate) builds the planets and the map with many calls to
+the random number generator. A catalog stores the start states once, with the tables the map
+would otherwise compute (the distances between the planets). The file is memory-mapped, so
+all processes that open it share the same memory, and only the maps that are used are read::
+
+    catalog.build('maps.cat', sizes=[6, 10], ids=range(1000))
+
+    maps = MapCatalog('maps.cat')
+    state, id = State.generate(6, 42, catalog=maps)
+
+A catalog can also hold a curated pool of maps (see build()): then use ids() to choose from them.
+
+The file is binary (little endian):
+
+ * A header: the magic bytes 'PWMC', the version (byte) and the number of maps (uint32).
+ * An index, with for each map: the number of planets (uint16), the id (uint32), whether it is
+   symmetric (byte) and the offset of the map in the file (uint32).
+ * The maps. For each planet: x, y and size (doubles), the garrison (int32) and the owner (byte).
+   Then the distances between all pairs of planets (doubles, row by row).
+"""
+
+import hashlib, mmap, struct
+
+from api import State, Map, Planet
+
+MAGIC = b'PWMC'
+
+# The version of the format. Increment this if it changes.
+VERSION = 1
+
+_HEADER = struct.Struct('<4sBI')
+_ENTRY = struct.Struct('<HIBI')
+_PLANET = struct.Struct('<dddib')
+
+
+class MapCatalog(object):
+    """
+    A catalog of start states, read from a file.
+    """
+
+    __slots__ = (
+        # The file, and the memory map of its contents
+        '__file',
+        '__data',           # type: mmap.mmap
+
+        # For each (number of planets, id): whether the map is symmetric, and its offset in the file
+        '__index',          # type: dict[tuple[int, int], tuple[bool, int]]
+
+        # The ids of the maps with each number of planets, in the order of the file
+        '__ids',            # type: dict[int, list[int]]
+
+        # The maps we have read so far (the same map object is returned for the same map)
+        '__maps',           # type: dict[tuple[int, int], tuple[Map, list[int], list[int]]]
+
+        # A hash of the file contents (None until digest() is called)
+        '__digest'          # type: str
+    )
+
+    def __init__(self,
+                 file   # type: str
+                ):
+        """
+        :param file: The catalog file (see build())
+        :raises: ValueError if the file is not a catalog, or has a different version
+        """
+        self.__file = open(file, 'rb')
+        self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = _HEADER.unpack_from(self.__data, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a map catalog.'.format(file))
+        if version != VERSION:
+            raise ValueError('Map catalog {} has version {}, expected {}.'.format(file, version, VERSION))
+
+        self.__index = {}
+        self.__ids = {}
+        self.__maps = {}
+        self.__digest = None
+
+        for i in range(count):
+            num_planets, id, symmetric, offset = _ENTRY.unpack_from(self.__data, _HEADER.size + i * _ENTRY.size)
+
+            self.__index[(num_planets, id)] = (bool(symmetric), offset)
+            self.__ids.setdefault(num_planets, []).append(id)
+
+    def sizes(self):
+        # type: () -> list[int]
+        """
+        :return: The numbers of planets of the maps in the catalog
+        """
+        return sorted(self.__ids.keys())
+
+    def ids(self,
+            num_planets     # type: int
+            ):
+        # type: () -> list[int]
+        """
+        :return: The ids of the maps with the given number of planets
+        """
+        return self.__ids.get(num_planets, [])
+
+    def contains(self,
+                 num_planets,       # type: int
+                 id,                # type: int
+                 symmetric=True     # type: bool
+                ):
+        # type: () -> bool
+        """
+        :return: Whether the catalog has the given map (with the given symmetry)
+        """
+        entry = self.__index.get((num_planets, id))
+        return entry is not None and entry[0] == symmetric
+
+    def state(self,
+              num_planets,  # type: int
+              id            # type: int
+            ):
+        # type: () -> State
+        """
+        :return: The start state of the given map
+        :raises: KeyError if the map is not in the catalog
+        """
+        key = (num_planets, id)
+
+        if key not in self.__maps:
+            _, offset = self.__index[key]
+
+            planets = []
+            garrisons = []
+            owners = []
+
+            for i in range(num_planets):
+                x, y, size, garrison, owner = _PLANET.unpack_from(self.__data, offset)
+                offset += _PLANET.size
+
+                planets.append(Planet(x, y, size, i))
+                garrisons.append(garrison)
+                owners.append(owner)
+
+            n = num_planets * num_planets
+            values = struct.unpack_from('<{}d'.format(n), self.__data, offset)
+            distances = [list(values[i:i + num_planets]) for i in range(0, n, num_planets)]
+
+            self.__maps[key] = (Map(planets, distances), garrisons, owners)
+
+        map, garrisons, owners = self.__maps[key]
+        return State(map, garrisons, owners)
+
+    def digest(self):
+        # type: () -> str
+        """
+        :return: A hash of the contents of the catalog file. Two catalogs with the same digest have
+            the same maps under the same ids (see ResultCache.key()).
+        """
+        if self.__digest is None:
+            digest = hashlib.sha1()
+            for start in range(0, len(self.__data), 1 << 20):
+                digest.update(self.__data[start:start + (1 << 20)])
+            self.__digest = digest.hexdigest()
+
+        return self.__digest
+
+    def __len__(self):
+        return len(self.__index)
+
+    def close(self):
+        self.__data.close()
+        self.__file.close()
+
+
+def build(file,             # type: str
+          sizes=(6,),       # type: list[int]
+          ids=range(1000),  # type: list[int]
+          symmetric=True,   # type: bool
+          states=None       # type: list[tuple[int, State]]
+          ):
+    """
+    Write a catalog file.
+
+    :param file: The file to write
+    :param sizes: The numbers of planets of the maps to generate
+    :param ids: The ids of the maps to generate (for each size): the maps are those State.generate()
+        gives for these ids
+    :param symmetric: Whether to generate symmetric maps (or, with states, whether they count as symmetric
+        maps for State.generate())
+    :param states: Instead of generating maps, store these: a list of pairs (id, start state), for
+        instance a curated pool of maps loaded with State.load_all(). The ids must be unique for each
+        number of planets.
+    """
+    if states is None:
+        states = [(id, State.generate(size, id, symmetric=symmetric)[0]) for size in sizes for id in ids]
+
+    offset = _HEADER.size + len(states) * _ENTRY.size
+
+    index = []
+    data = []
+
+    for id, state in states:
+        map = state.map()
+        index.append(_ENTRY.pack(map.size(), id, symmetric, offset))
+
+        for planet in map.planets():
+            data.append(_PLANET.pack(planet.coords()[0], planet.coords()[1], planet.size(),
+                                     state.garrison(planet), state.owner(planet)))
+
+        distances = [distance for row in map.distances() for distance in row]
+        data.append(struct.pack('<{}d'.format(len(distances)), *distances))
+
+        offset += map.size() * _PLANET.size + len(distances) * 8
+
+    with open(file, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(states)))
+        f.write(b''.join(index))
+        f.write(b''.join(data))
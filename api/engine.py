@@ -1,12 +1,12 @@
 """
 This file contains functions to regulate game play.
 """
-import matplotlib as mpl
-mpl.use('Agg')
-from matplotlib.backends.backend_pdf import PdfPages
-from api import State, Planet
+from api import State, Planet, Map
+from api.replay import ReplayWriter
 
-from multiprocessing import Process, Manager
+from multiprocessing import Process, Pipe
+
+import os, signal, tempfile, threading, time, traceback
 
 def play(
             player1,
@@ -15,10 +15,24 @@ def play(
             max_time=5000,      # type: int
             max_turns=100,      # type: int
             verbose=True,       # type: bool
-            outfile='game.pdf'  # type: str | None
+            outfile='game.pdf', # type: str | None
+            replay=None,        # type: str | None
+            isolate=True        # type: bool
         ):
     """
     Play a game between two given players, from the given starting state.
+
+    If replay is given, a replay of the game is written to that file while the game is played.
+    Use replay.render() to visualize the game afterwards. If outfile is given, the game is
+    visualized in that (pdf) file after it has been played.
+
+    Each player runs in its own process for the whole game. The players can also be given as
+    Worker objects, so that they keep running over several games (for instance in a tournament).
+
+    If isolate is False, the players are called in this process instead (see Local). This is
+    faster, but a bot that takes too long can only be stopped from the main thread (with a timer
+    signal). Use this if the game is already running in a separate process, for instance in a
+    process pool.
     """
     pr('player1: {}'.format(player1), verbose)
     pr('player2: {}'.format(player2), verbose)
@@ -27,13 +41,43 @@ def play(
     if state.whose_turn() != 1:
         raise ValueError('The starting state should have player 1 to move (found state.whose_turn() == {}).'.format(state.whose_turn()))
 
-    pdf = None
-    if outfile is not None:
-        pdf = PdfPages(outfile)
+    # Start a worker process for each player (unless it's a worker already)
+    workers = [player if isinstance(player, (Worker, Local)) else (Worker(player) if isolate else Local(player))
+               for player in (player1, player2)]
+
+    # To visualize the game, we need a replay (if none is asked for, we write it to a temporary file)
+    temporary = None
+    if outfile is not None and replay is None:
+        handle, temporary = tempfile.mkstemp(suffix='.replay')
+        os.close(handle)
+        replay = temporary
+
+    try:
+        winner = run(workers[0], workers[1], state, max_time, max_turns, verbose, replay)
+
+        if outfile is not None:
+            from api import replay as replays
+            replays.render(replay, outfile)
+
+        return winner
+    finally:
+        for player, worker in zip((player1, player2), workers):
+            if worker is not player:
+                worker.stop()
+
+        if temporary is not None:
+            os.remove(temporary)
+
+def run(player1, player2, state, max_time, max_turns, verbose, replay):
+    """
+    The game loop of play(), with the players given as workers. If replay is given, a replay of
+    the game is written to that file.
+    """
+    writer = None
+    if replay is not None:
+        writer = ReplayWriter(replay, state)
 
     pr(state, verbose)
-    if not pdf is None:
-        pdf.savefig(figure=state.visualize())
 
     # The game loop
     while not state.finished():
@@ -48,8 +92,8 @@ def play(
         state = state.next(move)
         pr(state, verbose)
 
-        if not pdf is None:
-            pdf.savefig(figure=state.visualize())
+        if not writer is None:
+            writer.move(move, state)
 
         if not state.revoked() is None:
             pr('!   Player {} revoked (made illegal move), game finished.'.format(state.revoked()), verbose)
@@ -62,54 +106,238 @@ def play(
     else:
         pr('Maximum turns exceed. No winner.', verbose)
 
-    if pdf is not None:
-        pdf.close()
+    if writer is not None:
+        writer.close(state.winner() if state.finished() else None)
 
     return state.winner() if state.finished() else None
 
 def get_move(state, player, max_time, verbose):
     """
-    Asks a player bot for a move. Creates a separate process, so we can kill
-    computation if ti exceeds a maximum time.
+    Asks a player bot for a move. The bot runs in a separate process, so we can kill
+    computation if it exceeds a maximum time.
     :param state:
-    :param player:
+    :param player: A Worker (or Local)
     :return:
     """
-    # We call the player bot in a separate process.This allows us to terminate
-    # if the player takes too long.
-    manager = Manager()
-    result = manager.dict() # result is a variable shared between our process and
-                            # the player's. This allows it to pass the move to us
+    move, status = player.get_move(state, max_time)
 
-    # Start a process with the function 'call_player' and the given arguments
-    process = Process(target=call_player, args=(player, state, result))
+    if status == Worker.TIMEOUT:
+        pr('!   Player {} took too long, no move made.'.format(state.whose_turn()), verbose)
+    elif status == Worker.CRASHED:
+        pr('!   Player {} crashed, no move made.'.format(state.whose_turn()), verbose)
 
-    # Start the process
-    process.start()
+    return move
 
-    # Rejoin at most max_time miliseconds later
-    process.join(max_time / 1000)
 
-    # Check if the process terminated in time
-    move = None
-    if process.is_alive():
-        pr('!   Player {} took too long, no move made.'.format(state.whose_turn()), verbose)
+class Worker(object):
+    """
+    Runs a bot in a separate, long-running process. The states are sent to the process over a pipe,
+    and it sends back the bot's moves. If the bot takes too long, the process is killed, and a new
+    one is started when the next move is asked for.
 
-        process.terminate()
-        process.join()
+    Note that the bot in the process is a copy: any changes to it (for instance caches it builds up
+    between moves) stay in the process.
 
-    else:
-        # extract the move
-        move = result['move']
+    The states are sent in a compact binary form (see State.to_bytes()). The map is only sent when
+    it changes, which is once per game.
+    """
 
-    return move
+    # The possible outcomes of asking for a move
+    OK = 0
+    TIMEOUT = 1
+    CRASHED = 2
+
+    __slots__ = (
+        # The bot
+        '__player',
+
+        # The process running the bot, and our end of the pipe to it (None if not started)
+        '__process',        # type: Process
+        '__connection',     # type: Connection
+
+        # The last map sent to the process
+        '__map'             # type: Map
+    )
+
+    def __init__(self, player):
+        self.__player = player
+        self.__process = None
+        self.__connection = None
+        self.__map = None
+
+    def start(self):
+        """
+        Start the process (this is done automatically by get_move()).
+        """
+        connection, child = Pipe()
+
+        self.__process = Process(target=serve, args=(self.__player, child))
+        self.__process.daemon = True
+        self.__process.start()
+
+        # (the process has its own copy of its end of the pipe)
+        child.close()
+
+        self.__connection = connection
+
+    def get_move(self,
+                 state,     # type: State
+                 max_time   # type: int
+                ):
+        # type: () -> (tuple[int, int], int)
+        """
+        Ask the bot for a move.
+
+        :param state: The state in which the bot should move
+        :param max_time: How long the bot may take (in milliseconds)
+        :return: A pair of the move (None if the bot didn't give one in time) and the status: OK,
+            TIMEOUT or CRASHED
+        """
+        if self.__process is None:
+            self.start()
+
+        if state.map() is not self.__map:
+            self.__map = state.map()
+            self.__connection.send(self.__map)
+
+        self.__connection.send(state.to_bytes())
+
+        # Wait until the deadline for the move
+        if not self.__connection.poll(max_time / 1000.0):
+            self.kill()
+            return None, Worker.TIMEOUT
+
+        try:
+            return self.__connection.recv(), Worker.OK
+        except EOFError:
+            # The process died (the bot raised an exception)
+            self.kill()
+            return None, Worker.CRASHED
+
+    def kill(self):
+        """
+        Terminate the process immediately.
+        """
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.join()
+            self.__connection.close()
+
+        self.__process = None
+        self.__connection = None
+        self.__map = None
+
+    def stop(self):
+        """
+        Ask the process to finish, and wait for it.
+        """
+        if self.__process is not None:
+            try:
+                self.__connection.send(None)
+            except IOError:
+                pass
+
+            self.__process.join(1)
+
+        self.kill()
+
+    def __repr__(self):
+        return repr(self.__player)
+
+
+class _Timeout(BaseException):
+    """
+    Raised in a bot run by Local when its time is up. (It's not an Exception, so that the bot
+    doesn't catch it with 'except Exception'.)
+    """
+
+
+def _alarm(signum, frame):
+    raise _Timeout()
+
+
+class Local(object):
+    """
+    Runs a bot in this process, with the same interface as Worker. The bot gets a copy of the
+    state, so it can't change the state of the game (even if it crashes halfway through apply()
+    and undo()).
+
+    A bot that takes too long is interrupted with a timer signal (SIGALRM), and its move is thrown
+    away. This only works in the main thread, on systems that have the signal (not Windows).
+    Otherwise, the bot can't be interrupted: it holds up the game, and its move is thrown away
+    afterwards, as if it had been stopped.
+    """
 
-def call_player(player, state, result):
-    # Call the player to make the move
-    move = player.get_move(state)
-    # Put the move in the shared variable, so it can be read by the
-    # engine process
-    result['move'] = move
+    __slots__ = (
+        # The bot
+        '__player',
+    )
+
+    def __init__(self, player):
+        self.__player = player
+
+    def get_move(self,
+                 state,     # type: State
+                 max_time   # type: int
+                ):
+        # type: () -> (tuple[int, int], int)
+        """
+        Ask the bot for a move.
+
+        :param state: The state in which the bot should move
+        :param max_time: How long the bot may take (in milliseconds)
+        :return: A pair of the move (None if the bot took too long) and the status: Worker.OK,
+            Worker.TIMEOUT or Worker.CRASHED
+        """
+        start = time.time()
+
+        alarm = hasattr(signal, 'setitimer') and isinstance(threading.current_thread(), threading._MainThread)
+        if alarm:
+            previous = signal.signal(signal.SIGALRM, _alarm)
+            signal.setitimer(signal.ITIMER_REAL, max_time / 1000.0)
+
+        try:
+            move = self.__player.get_move(state.clone())
+        except _Timeout:
+            return None, Worker.TIMEOUT
+        except Exception:
+            traceback.print_exc()
+            return None, Worker.CRASHED
+        finally:
+            if alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+
+        if (time.time() - start) * 1000 > max_time:
+            return None, Worker.TIMEOUT
+
+        return move, Worker.OK
+
+    def stop(self):
+        pass
+
+    def __repr__(self):
+        return repr(self.__player)
+
+
+def serve(player, connection):
+    """
+    The main loop of a worker process: receive states, and send back the player's moves, until
+    None is received. A Map object means that the states that follow are on that map.
+    """
+    map = None
+
+    while True:
+        message = connection.recv()
+
+        if message is None:
+            break
+
+        if isinstance(message, Map):
+            map = message
+            continue
+
+        connection.send(player.get_move(State.from_bytes(map, message)))
 
 
 def other(p):
@@ -136,6 +364,10 @@ def check(
     :param move:
     :param player:
     """
+    # Encoded moves (see Map.encode()) are single integers
+    if type(move) is int:
+        return
+
     if not move is None:
         if not type(move) is tuple:
             raise RuntimeError(
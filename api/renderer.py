@@ -0,0 +1,171 @@
+"""
+Draws states with matplotlib.
+
+A Renderer keeps one figure, and reuses it for every state it draws. The axes and the
+planets are only drawn when the map changes. For each state, only the owners, the
+garrisons and the fleets are updated. This makes it much cheaper to draw all the states
+of a game than calling State.visualize() for each::
+
+    renderer = Renderer()
+    pdf = PdfPages('game.pdf')
+
+    for state in states:
+        pdf.savefig(figure=renderer.render(state))
+
+The figure is not registered with pyplot, so it is freed when the renderer is.
+"""
+
+import math
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+
+import api.util as u
+from api._state import mult, plus
+
+# The colors of the players (0 is neutral)
+COLORS = ['gray', 'blue', 'red']
+
+
+class Renderer(object):
+    """
+    Draws states, reusing a single figure.
+    """
+
+    __slots__ = (
+        # The figure, and the axes we draw in
+        '__figure',         # type: Figure
+        '__axes',           # type: Axes
+
+        # The map drawn in the axes (None if nothing has been drawn yet)
+        '__map',            # type: Map
+
+        # The planets (one scatter plot) and their garrisons (one text per planet)
+        '__planets',        # type: PathCollection
+        '__garrisons',      # type: list[Annotation]
+
+        # The fleets: their paths, their markers (one scatter plot) and their sizes. We keep
+        # enough texts for the most fleets we've seen, and hide the ones we don't need.
+        '__paths',          # type: LineCollection
+        '__fleets',         # type: PathCollection
+        '__sizes'           # type: list[Annotation]
+    )
+
+    def __init__(self):
+        self.__figure = Figure(figsize=(6,6))
+        FigureCanvasAgg(self.__figure)
+
+        self.__axes = None
+        self.__map = None
+
+    def render(self,
+               state    # type: State
+            ):
+        # type: () -> Figure
+        """
+        Draw the given state.
+
+        :return: The figure (the same object for every call). Save it to a file (or a page of a pdf)
+            before drawing the next state.
+        """
+        if state.map() is not self.__map:
+            self.__draw_map(state.map())
+
+        planets = state.planets()
+
+        # Update the planets
+        self.__planets.set_facecolors([COLORS[state.owner(planet)] for planet in planets])
+        for planet, text in zip(planets, self.__garrisons):
+            text.set_text(str(state.garrison(planet)))
+
+        # Update the fleets
+        fleets = state.fleets()
+
+        paths = []
+        locations = []
+        colors = []
+
+        for fleet in fleets:
+            source = fleet.source().coords()
+            target = fleet.target().coords()
+
+            turns_left = fleet.distance()
+            max_turns = state.map().distance(fleet.source(), fleet.target()) / u.SPEED
+
+            ratio = 0.5 if max_turns == 0 else float(turns_left) / float(max_turns) # scale the distance travelled to target to the range (0, 1)
+
+            paths.append([source, target])
+            locations.append(plus(mult(source, ratio), mult(target, 1.0 - ratio))) # Current location of the fleet
+            colors.append(COLORS[fleet.owner()])
+
+        self.__paths.set_segments(paths)
+        self.__paths.set_color(colors)
+
+        self.__fleets.set_offsets(locations if len(locations) > 0 else [[float('nan'), float('nan')]])
+        self.__fleets.set_sizes([math.sqrt(fleet.size()) * 20 for fleet in fleets])
+        self.__fleets.set_facecolors(colors)
+
+        while len(self.__sizes) < len(fleets):
+            self.__sizes.append(self.__axes.annotate(
+                '', xy=(0, 0), xytext=(0, - 20),
+                textcoords='offset points', ha='center', va='bottom', zorder=30))
+
+        for i, text in enumerate(self.__sizes):
+            if i < len(fleets):
+                text.set_text(str(fleets[i].size()))
+                text.xy = locations[i]
+                text.set_color(colors[i])
+                text.set_visible(True)
+            else:
+                text.set_visible(False)
+
+        self.__axes.set_title('turn {}.{}: '.format(state.turn_nr(), state.whose_turn()))
+
+        return self.__figure
+
+    def __draw_map(self, map):
+        """
+        Start again with a new map: draw the axes and the planets.
+        """
+        self.__figure.clear()
+        self.__map = map
+
+        ax = self.__figure.add_subplot(111)
+        self.__axes = ax
+
+        # (set_axis_bgcolor was replaced by set_facecolor in matplotlib 2.0)
+        if hasattr(ax, 'set_facecolor'):
+            ax.set_facecolor('#19102b')
+        else:
+            ax.set_axis_bgcolor('#19102b')
+
+        # Plot the planets
+        xs = [planet.coords()[0] for planet in map.planets()]
+        ys = [planet.coords()[1] for planet in map.planets()]
+        sizes = [planet.size() * 500 for planet in map.planets()]
+
+        self.__planets = ax.scatter(xs, ys, s=sizes, c=[COLORS[0]] * len(xs), zorder=10, linewidth=0)
+
+        self.__garrisons = []
+        for x, y, size in zip(xs, ys, sizes):
+            self.__garrisons.append(ax.annotate(
+                '',
+                xy=(x, y), xytext=(0, - 15 - size/50.0),
+                textcoords='offset points', ha='center', va='bottom',
+                zorder=30, color='white'))
+
+        # The fleets (empty for now)
+        self.__paths = LineCollection([], alpha=0.8, linestyles='dotted')
+        ax.add_collection(self.__paths)
+
+        self.__fleets = ax.scatter([float('nan')], [float('nan')], marker='s', linewidth=0, zorder=20)
+        self.__sizes = []
+
+        ax.spines["right"].set_visible(False)
+        ax.spines["top"].set_visible(False)
+        ax.spines["bottom"].set_visible(False)
+        ax.spines["left"].set_visible(False)
+
+        ax.get_xaxis().set_tick_params(which='both', top='off', bottom='off', labelbottom='off')
+        ax.get_yaxis().set_tick_params(which='both', left='off', right='off', labelleft='off')
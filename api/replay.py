@@ -0,0 +1,186 @@
+"""
+Replays: a log of a game, written while it is played, from which the game can be
+reconstructed (and visualized) afterwards.
+
+A replay is a text file with one JSON object per line:
+
+ * The first line describes the start of the game: the map (the coordinates, size
+   and id of each planet) and the start state.
+ * Then there is a line for every move, in the order they were made.
+ * Every few plies there is a checkpoint: the state after the last move. These are
+   used to check that the game is reconstructed correctly.
+ * The last line gives the winner (if the game was played to the end).
+
+States are stored in the binary encoding of State.to_bytes() (base64 encoded).
+
+Writing a replay is cheap, so it can be done during the game without slowing it
+down. To visualize a game, render the replay afterwards::
+
+    replay.render('game.replay', 'game.pdf')
+"""
+
+import base64, json
+
+from api import State, Planet, Map
+
+# The version of the format. Increment this if it changes.
+VERSION = 1
+
+
+class ReplayWriter(object):
+    """
+    Writes a replay, one move at a time.
+    """
+
+    __slots__ = (
+        # The file we're writing to
+        '__file',
+
+        # Whether we opened the file (and so should close it)
+        '__own',            # type: bool
+
+        # How often (in plies) to write a checkpoint. 0 for never.
+        '__checkpoint',     # type: int
+
+        # How many moves have been written
+        '__moves'           # type: int
+    )
+
+    def __init__(self,
+                 file,          # type: str | file
+                 state,         # type: State
+                 checkpoint=10  # type: int
+                ):
+        """
+        :param file: The file to write to: a filename or a file object
+        :param state: The start state of the game
+        :param checkpoint: Write the state every this many plies (0 for never)
+        """
+        self.__own = isinstance(file, basestring)
+        self.__file = open(file, 'w') if self.__own else file
+        self.__checkpoint = checkpoint
+        self.__moves = 0
+
+        planets = [[p.coords()[0], p.coords()[1], p.size(), p.id()] for p in state.map().planets()]
+
+        self.__write({'type': 'start', 'version': VERSION, 'map': planets, 'state': _encode(state)})
+
+    def move(self,
+             move,  # type: tuple[int, int]
+             state  # type: State
+            ):
+        """
+        Add a move to the replay.
+
+        :param move: The move that was made
+        :param state: The state after the move
+        """
+        if isinstance(move, int):
+            move = state.map().decode(move)
+
+        self.__write({'type': 'move', 'move': None if move is None else list(move)})
+        self.__moves += 1
+
+        if self.__checkpoint > 0 and self.__moves % self.__checkpoint == 0:
+            self.__write({'type': 'state', 'ply': self.__moves, 'state': _encode(state)})
+            self.__file.flush()
+
+    def close(self,
+              winner=None   # type: int
+            ):
+        """
+        Finish the replay.
+
+        :param winner: The player who won, or None if the game was not finished
+        """
+        self.__write({'type': 'end', 'winner': winner})
+
+        if self.__own:
+            self.__file.close()
+        else:
+            self.__file.flush()
+
+    def __write(self, record):
+        self.__file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def read(file):
+    """
+    Reconstruct a game from a replay.
+
+    :param file: The replay: a filename or a file object
+    :return: A generator of the states of the game, starting with the start state.
+    :raises: ValueError if the replay is not valid, or a checkpoint doesn't match the
+        reconstructed game.
+    """
+    own = isinstance(file, basestring)
+    f = open(file, 'r') if own else file
+
+    try:
+        state = None
+        ply = 0
+
+        for number, line in enumerate(f, 1):
+            if line.strip() == '':
+                continue
+
+            record = json.loads(line)
+            kind = record.get('type')
+
+            if state is None:
+                if kind != 'start':
+                    raise ValueError('Line {}: a replay should start with the start of the game.'.format(number))
+                if record['version'] != VERSION:
+                    raise ValueError('Replay has version {}, expected {}.'.format(record['version'], VERSION))
+
+                map = Map([Planet(x, y, size, id) for x, y, size, id in record['map']])
+                state = _decode(map, record['state'])
+
+                yield state
+
+            elif kind == 'move':
+                move = record['move']
+                state = state.next(None if move is None else tuple(move))
+                ply += 1
+
+                yield state
+
+            elif kind == 'state':
+                if record['ply'] != ply or _decode(state.map(), record['state']) != state:
+                    raise ValueError('Line {}: the game does not match the checkpoint at ply {}.'.format(number, record['ply']))
+
+            elif kind == 'end':
+                break
+
+            else:
+                raise ValueError('Line {}: unknown record type {}.'.format(number, kind))
+    finally:
+        if own:
+            f.close()
+
+
+def render(file, outfile):
+    """
+    Visualize the game in a replay: write a pdf with a page for every state.
+
+    :param file: The replay: a filename or a file object
+    :param outfile: The pdf file to write
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+    from api.renderer import Renderer
+
+    renderer = Renderer()
+    pdf = PdfPages(outfile)
+
+    try:
+        for state in read(file):
+            pdf.savefig(figure=renderer.render(state))
+    finally:
+        pdf.close()
+
+
+def _encode(state):
+    return base64.b64encode(state.to_bytes())
+
+def _decode(map, data):
+    return State.from_bytes(map, base64.b64decode(data))
@@ -0,0 +1,152 @@
+"""
+A store of game results, so that tournaments can reuse the games they've played before.
+
+Each result is keyed by everything that decides the outcome of a game: the bots (the
+hash of their source code and their parameters) and the seat they played in, the map
+size and seed (and the map catalog the seed is an id in, if any), the rules (the
+maximum number of turns and the time per move, and whether the start state was
+symmetric), and the round, to tell apart repeats of the same game. When a bot changes, its key changes, so only the games involving that
+bot are played again::
+
+    cache = ResultCache('results.jsonl')
+    key = cache.key(bot1, bot2, map_size, seed)
+
+    if key not in cache:
+        cache.put(key, engine.play(bot1, bot2, ...))
+
+    winner = cache.get(key)
+
+The results are kept in a text file with one JSON object per line. New results are
+appended, so the file can be shared by (sequential) tournaments.
+"""
+
+import glob, hashlib, inspect, json, os
+
+
+class ResultCache(object):
+    """
+    Game results, stored in a file.
+    """
+
+    __slots__ = (
+        # The file the results are appended to
+        '__file',           # type: str
+
+        # The results so far: key -> winning seat (1 or 2), or None for a draw
+        '__results',        # type: dict[tuple, int]
+
+        # The keys of the bots we've seen, by id(bot)
+        '__bots'            # type: dict[int, str]
+    )
+
+    def __init__(self,
+                 file   # type: str
+                ):
+        """
+        :param file: The file to read the results from, and to add new results to (created if it
+            doesn't exist)
+        """
+        self.__file = file
+        self.__results = {}
+        self.__bots = {}
+
+        if os.path.exists(file):
+            with open(file, 'r') as f:
+                for line in f:
+                    if line.strip() == '':
+                        continue
+
+                    record = json.loads(line)
+                    self.__results[self.__tuple(record)] = record['winner']
+
+    def key(self,
+            bot1,               # type: Bot
+            bot2,               # type: Bot
+            map_size,           # type: int
+            seed,               # type: int
+            max_turns=100,      # type: int
+            symmetric=True,     # type: bool
+            maps=None,          # type: str
+            round=0,            # type: int
+            max_time=None       # type: float
+            ):
+        # type: () -> dict
+        """
+        :param bot1: The bot that plays as player 1
+        :param bot2: The bot that plays as player 2
+        :param maps: If the map was taken from a catalog (and the seed is its id there), the digest
+            of the catalog (see MapCatalog.digest()). None for a generated map.
+        :param round: Which repeat of the game this is (bots that play randomly can play the same
+            game with the same seats and map several times, with different results)
+        :param max_time: The time the bots had per move
+        :return: The key of a game with the given bots, seats and map
+        """
+        return {'bots': [self.bot_key(bot1), self.bot_key(bot2)], 'map': map_size, 'seed': seed,
+                'max_turns': max_turns, 'symmetric': symmetric, 'maps': maps, 'round': round,
+                'max_time': max_time}
+
+    def bot_key(self,
+                bot     # type: Bot
+            ):
+        # type: () -> str
+        """
+        :return: A hash of the source code of the given bot (all python files in its directory)
+            and its parameters (the numbers, strings and booleans in its attributes).
+        """
+        if id(bot) not in self.__bots:
+            digest = hashlib.sha1()
+
+            directory = os.path.dirname(os.path.abspath(inspect.getfile(bot.__class__)))
+            for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+                with open(path, 'rb') as f:
+                    digest.update(os.path.basename(path).encode('utf-8'))
+                    digest.update(f.read())
+
+            params = sorted((name, value) for name, value in getattr(bot, '__dict__', {}).items()
+                            if isinstance(value, (bool, int, long, float, basestring)))
+            digest.update(repr(params).encode('utf-8'))
+
+            self.__bots[id(bot)] = digest.hexdigest()
+
+        return self.__bots[id(bot)]
+
+    def __contains__(self, key):
+        return self.__tuple(key) in self.__results
+
+    def get(self,
+            key     # type: dict
+            ):
+        # type: () -> int
+        """
+        :return: The seat that won the game with the given key (1 or 2), or None for a draw.
+        :raises: KeyError if the game hasn't been played.
+        """
+        return self.__results[self.__tuple(key)]
+
+    def put(self,
+            key,    # type: dict
+            winner  # type: int
+            ):
+        """
+        Store the result of a game.
+
+        :param winner: The seat that won the game (1 or 2), or None for a draw
+        """
+        self.__results[self.__tuple(key)] = winner
+
+        record = dict(key)
+        record['winner'] = winner
+
+        with open(self.__file, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n')
+
+    def __len__(self):
+        return len(self.__results)
+
+    @staticmethod
+    def __tuple(key):
+        # (results stored by older versions may lack 'maps', 'round' and 'max_time'. Such a result
+        # may have been any round, so it's not reused for the games we play now.)
+        return tuple(key['bots']), key['map'], key['seed'], key['max_turns'], key['symmetric'], key.get('maps'), \
+            key.get('round'), key.get('max_time')
+
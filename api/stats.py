@@ -0,0 +1,238 @@
+"""
+Statistics for tournaments.
+"""
+
+import math, random
+
+
+class SPRT(object):
+    """
+    A sequential probability ratio test for a match between two bots: after each game, it tells us
+    whether we have seen enough games to say which bot is better.
+
+    We test the hypothesis that the first bot wins a game with probability 0.5 + delta against the
+    hypothesis that it wins with probability 0.5 - delta (draws are ignored). The test stops as soon
+    as the evidence for one of them is strong enough: the probability of picking the wrong bot
+    is then at most alpha (if the bots really differ by delta or more). If the bots are about equally
+    strong, it can take many games to decide, so the caller should set a maximum.
+
+    Example::
+
+        test = SPRT()
+        while test.decided() is None and games < max_games:
+            test.add(play_game())
+
+        print('{} is better, confidence {:.3f}'.format(test.decided(), test.confidence()))
+    """
+
+    __slots__ = (
+        # The games won by each bot (index 1 and 2), and the number of draws (index 0)
+        '__wins',       # type: list[int]
+
+        # The evidence for one bot winning a game (the log likelihood ratio per won game)
+        '__step',       # type: float
+
+        # The log likelihood ratio at which we decide for the first bot (upper) or the second (lower)
+        '__upper',      # type: float
+        '__lower'       # type: float
+    )
+
+    def __init__(self,
+                 delta=0.1,     # type: float
+                 alpha=0.05,    # type: float
+                 beta=0.05      # type: float
+                ):
+        """
+        :param delta: How much better than 50/50 a bot should be, to count as better
+        :param alpha: The probability of deciding that the first bot is better when it isn't
+        :param beta: The probability of deciding that the second bot is better when it isn't
+        """
+        if not 0.0 < delta < 0.5:
+            raise ValueError('delta should be between 0 and 0.5 (found {}).'.format(delta))
+
+        self.__wins = [0, 0, 0]
+        self.__step = math.log((0.5 + delta) / (0.5 - delta))
+        self.__upper = math.log((1.0 - beta) / alpha)
+        self.__lower = math.log(beta / (1.0 - alpha))
+
+    def add(self,
+            winner  # type: int
+            ):
+        """
+        Add the result of a game.
+
+        :param winner: The bot that won (1 or 2), or None for a draw
+        """
+        self.__wins[0 if winner is None else winner] += 1
+
+    def wins(self,
+             bot    # type: int
+            ):
+        # type: () -> int
+        """
+        :param bot: 1 or 2 (or 0 for the number of draws)
+        :return: The number of games won by the given bot
+        """
+        return self.__wins[bot]
+
+    def games(self):
+        # type: () -> int
+        """
+        :return: The number of games added (including draws)
+        """
+        return sum(self.__wins)
+
+    def llr(self):
+        # type: () -> float
+        """
+        :return: The log likelihood ratio: positive numbers favour the first bot, negative numbers the second.
+        """
+        return (self.__wins[1] - self.__wins[2]) * self.__step
+
+    def decided(self):
+        # type: () -> int
+        """
+        :return: The bot that is better (1 or 2), or None if the test hasn't decided yet.
+        """
+        llr = self.llr()
+
+        if llr >= self.__upper:
+            return 1
+        if llr <= self.__lower:
+            return 2
+
+        return None
+
+    def confidence(self):
+        # type: () -> float
+        """
+        :return: How sure we are about the bot that is ahead, between 0.5 (no idea) and 1.0: the
+            probability of the hypothesis that it is the better bot, if both hypotheses were equally
+            likely before the match.
+        """
+        return 1.0 / (1.0 + math.exp(- abs(self.llr())))
+
+
+class Elo(object):
+    """
+    Elo ratings for a league of bots, updated after every game. Bots are numbered 0 to n-1.
+
+    The ratings are also used to schedule a Swiss-style league: in each round, bots are paired
+    with the bot nearest to them in the ranking that they haven't played yet. After a few rounds,
+    the strong bots only play strong bots, and the ranking settles with O(n log n) games, instead
+    of the n*(n-1)/2 pairs of a full round robin.
+    """
+
+    __slots__ = (
+        # The rating of each bot
+        '__ratings',    # type: list[float]
+
+        # The number of games played by each bot
+        '__games',      # type: list[int]
+
+        # How much a single game can change a rating
+        '__k'           # type: float
+    )
+
+    def __init__(self,
+                 n,             # type: int
+                 k=32.0,        # type: float
+                 start=1500.0   # type: float
+                ):
+        """
+        :param n: The number of bots
+        :param k: How much a single game can change a rating (bigger is faster, but noisier)
+        :param start: The rating of a bot that hasn't played yet
+        """
+        self.__ratings = [float(start)] * n
+        self.__games = [0] * n
+        self.__k = k
+
+    def rating(self,
+               bot  # type: int
+            ):
+        # type: () -> float
+        """
+        :return: The current rating of the given bot
+        """
+        return self.__ratings[bot]
+
+    def games(self,
+              bot   # type: int
+            ):
+        # type: () -> int
+        """
+        :return: The number of games played by the given bot
+        """
+        return self.__games[bot]
+
+    def expected(self,
+                 a,     # type: int
+                 b      # type: int
+                ):
+        # type: () -> float
+        """
+        :return: The expected score of bot a against bot b (the probability that a wins, counting
+            a draw as half a win)
+        """
+        return 1.0 / (1.0 + 10.0 ** ((self.__ratings[b] - self.__ratings[a]) / 400.0))
+
+    def add(self,
+            a,      # type: int
+            b,      # type: int
+            winner  # type: int
+            ):
+        """
+        Add the result of a game between bots a and b.
+
+        :param winner: The bot that won (a or b), or None for a draw
+        """
+        score = 0.5 if winner is None else (1.0 if winner == a else 0.0)
+        change = self.__k * (score - self.expected(a, b))
+
+        self.__ratings[a] += change
+        self.__ratings[b] -= change
+
+        self.__games[a] += 1
+        self.__games[b] += 1
+
+    def ranking(self):
+        # type: () -> list[int]
+        """
+        :return: The bots, from the highest rating to the lowest
+        """
+        return sorted(range(len(self.__ratings)), key=lambda bot: self.__ratings[bot], reverse=True)
+
+    def pairings(self,
+                 played=(),         # type: set[frozenset[int]]
+                 rng=random         # type: random.Random
+                ):
+        # type: () -> list[tuple[int, int]]
+        """
+        The pairs of bots for the next round of a Swiss-style league. Going down the ranking, each
+        bot is paired with the next bot it hasn't played yet (or just the next bot, if it has played
+        all of them). With an odd number of bots, one bot sits out the round: the lowest rated of
+        the bots that have played the most games (so the same bot doesn't sit out every round).
+
+        :param played: The pairs that have already played each other, as frozensets of two bots
+        :param rng: Used to break ties between bots with the same rating (as in the first round)
+        :return: A list of pairs (a, b), with a rated at least as high as b
+        """
+        order = list(range(len(self.__ratings)))
+        rng.shuffle(order)
+        order.sort(key=lambda bot: self.__ratings[bot], reverse=True)
+
+        if len(order) % 2 == 1:
+            most = max(self.__games)
+            bye = [bot for bot in order if self.__games[bot] == most][-1]
+            order.remove(bye)
+
+        pairs = []
+        while len(order) > 1:
+            a = order.pop(0)
+            b = next((bot for bot in order if frozenset((a, bot)) not in played), order[0])
+
+            order.remove(b)
+            pairs.append((a, b))
+
+        return pairs
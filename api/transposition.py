@@ -0,0 +1,120 @@
+"""
+A transposition table for search bots.
+
+In a game tree, the same state can often be reached by different sequences of
+moves (a transposition). A transposition table remembers what a search found
+out about a state, so that the search doesn't need to repeat itself when it
+sees the state again.
+
+Example (inside an alpha-beta search)::
+
+    entry = table.lookup(state)
+    if entry is not None:
+        depth, value, bound, move = entry
+        ...
+
+    table.store(state, depth, value, bound, move)
+
+The table has a fixed size. If two states end up in the same slot, the one
+that was searched deeper is kept.
+"""
+
+# The kinds of value stored in the table
+# The value is the exact value of the state
+EXACT = 0
+# The value is a lower bound: the real value is at least this big (the search was cut off at beta)
+LOWER = 1
+# The value is an upper bound: the real value is at most this big (no move was better than alpha)
+UPPER = 2
+
+# A rough estimate of how much memory one entry takes in python (the tuple, its
+# contents and the slot in the list)
+ENTRY_BYTES = 128
+
+
+class TranspositionTable(object):
+    """
+    A fixed size table mapping (the hashes of) states to the results of a search.
+    """
+
+    __slots__ = (
+        # The slots of the table: None or a tuple (key, generation, depth, value, bound, move)
+        '__entries',    # type: list[tuple]
+
+        # The current search. Entries from earlier searches can always be replaced.
+        '__generation'  # type: int
+    )
+
+    def __init__(self,
+                 megabytes=16   # type: float
+                ):
+        """
+        :param megabytes: How much memory the table may use (roughly). This determines the
+            number of entries.
+        """
+        size = max(1, int(megabytes * 1024 * 1024) // ENTRY_BYTES)
+
+        self.__entries = [None] * size
+        self.__generation = 0
+
+    def new_search(self):
+        """
+        Mark the start of a new search (ie. a new call to get_move). The entries from earlier searches
+        stay valid, but they will be replaced by new entries, regardless of their depth.
+        """
+        self.__generation += 1
+
+    def lookup(self,
+               state    # type: State
+            ):
+        # type: () -> tuple
+        """
+        :return: None if the state isn't in the table, otherwise a tuple (depth, value, bound, move)
+            with the depth to which the state was searched, the value found, what kind of value
+            it is (EXACT, LOWER or UPPER) and the best move found.
+        """
+        key = hash(state)
+        entry = self.__entries[key % len(self.__entries)]
+
+        if entry is None or entry[0] != key:
+            return None
+
+        return entry[2:]
+
+    def store(self,
+              state,    # type: State
+              depth,    # type: int
+              value,    # type: float
+              bound,    # type: int
+              move      # type: tuple[int, int]
+            ):
+        """
+        Store the result of a search in the table.
+
+        :param state: The state that was searched
+        :param depth: How many plies deep the state was searched
+        :param value: The value that the search found
+        :param bound: What kind of value it is: EXACT, LOWER or UPPER
+        :param move: The best move found in the state
+        """
+        key = hash(state)
+        index = key % len(self.__entries)
+        entry = self.__entries[index]
+
+        # Depth-preferred replacement: keep whichever entry took the most work,
+        # unless the old one is left over from an earlier search
+        if entry is None or entry[1] != self.__generation or depth >= entry[2]:
+            self.__entries[index] = (key, self.__generation, depth, value, bound, move)
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self.__entries = [None] * len(self.__entries)
+
+    def __len__(self):
+        # type: () -> int
+        """
+        :return: The number of slots in the table.
+        """
+        return len(self.__entries)
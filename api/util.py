@@ -43,22 +43,8 @@ def ratio_ships(state, owner_id):
     """
     :return: the ratio of the number of ships belonging to given player to the total
     """
-    p1ships = 0
-    totalships = 0
-
-    # Count the planets
-    for planet in state.planets():
-        totalships += state.garrison(planet)
-        if state.owner(planet) == owner_id:
-            p1ships += state.garrison(planet)
-
-    # Count the fleets
-    for fleet in state.fleets():
-        totalships += fleet.size()
-        if fleet.owner() == owner_id:
-            p1ships += fleet.size()
-
-    return float(p1ships) / float(totalships)
+    # The state keeps count of the ships (on planets and in fleets)
+    return float(state.ships(owner_id)) / float(state.ships())
 
 
 def combine_heuristics(*args):
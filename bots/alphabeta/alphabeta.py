@@ -5,6 +5,7 @@
 """
 
 from api import State, util
+from api.transposition import TranspositionTable, EXACT, LOWER, UPPER
 import random
 
 class Bot:
@@ -12,11 +13,20 @@ class Bot:
     __max_depth = -1
     __randomize = True
 
-    def __init__(self, randomize=True, depth=4):
+    # Remembers the values of the states we've already searched
+    __table = None # type: TranspositionTable
+
+    def __init__(self, randomize=True, depth=4, table_size=16):
+        """
+        :param table_size: How much memory (in MB) the transposition table may use
+        """
         self.__randomize = randomize
         self.__max_depth = depth
+        self.__table = TranspositionTable(table_size)
 
     def get_move(self, state):
+        self.__table.new_search()
+
         val, move = self.value(state)
 
         return move # to do nothing, return None
@@ -36,6 +46,25 @@ class Bot:
         if depth == self.__max_depth:
             return heuristic(state)
 
+        # If we've seen this state before (searched at least as deep as we need now), we may be
+        # able to use what we found then
+        known = self.__table.lookup(state)
+        if known is not None:
+            known_depth, known_value, bound, known_move = known
+
+            if known_depth >= self.__max_depth - depth:
+                if bound == EXACT:
+                    return known_value, known_move
+                if bound == LOWER:
+                    alpha = max(alpha, known_value)
+                if bound == UPPER:
+                    beta = min(beta, known_value)
+                if alpha >= beta:
+                    return known_value, known_move
+
+        # Remember the window we searched with, to tell what kind of value we find
+        alpha_start, beta_start = alpha, beta
+
         best_value = float('-inf') if maximizing(state) else float('inf')
         best_move = None
 
@@ -44,6 +73,11 @@ class Bot:
         if self.__randomize:
             random.shuffle(moves)
 
+        # Try the best move we found before first: it's the most likely to let us prune
+        if known is not None and known_move in moves:
+            moves.remove(known_move)
+            moves.insert(0, known_move)
+
         for move in moves:
 
             next_state = state.next(move)
@@ -65,6 +99,15 @@ class Bot:
             if ???:
                 break
 
+        if best_value <= alpha_start:
+            bound = UPPER # No move was better than alpha: the real value may be lower
+        elif best_value >= beta_start:
+            bound = LOWER # We stopped searching at beta: the real value may be higher
+        else:
+            bound = EXACT
+
+        self.__table.store(state, self.__max_depth - depth, best_value, bound, best_move)
+
         return best_value, best_move
 
 def maximizing(state):
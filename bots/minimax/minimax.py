@@ -41,17 +41,15 @@ class Bot:
         if depth == self.__max_depth:
             return heuristic(state)
 
-        moves = state.moves()
+        successors = list(state.successors())
 
         if self.__randomize:
-            random.shuffle(moves)
+            random.shuffle(successors)
 
         best_value = float('-inf') if maximizing(state) else float('inf')
         best_move = None
 
-        for move in moves:
-
-            next_state = state.next(move)
+        for move, next_state in successors:
 
             # IMPLEMENT: Add a recursive function call so that 'value' will contain the
             # minimax value of 'next_state'
@@ -7,8 +7,6 @@ A basic adaptive bot. This is part of the second worksheet.
 from api import State, util
 import random, os
 
-from sklearn.externals import joblib
-
 DEFAULT_MODEL = os.path.dirname(os.path.realpath(__file__)) + '/model.pkl'
 
 class Bot:
@@ -24,7 +22,8 @@ class Bot:
         self.__randomize = randomize
         self.__max_depth = depth
 
-        # Load the model
+        # Load the model (sklearn is only imported here, since it takes a long time to load)
+        from sklearn.externals import joblib
         self.__model = joblib.load(model_file)
 
     def get_move(self, state):
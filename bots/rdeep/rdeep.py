@@ -2,8 +2,8 @@
 """
 RdeepBot - This bot looks ahead by following a random path down the game tree. That is,
  it assumes that all players have the same strategy as rand.py, and samples N random
- games following from a given move. It then ranks the moves by averiging the heuristics
- of the resulting states.
+ games following from a given move. It averages the heuristics of the resulting states,
+ does this N times for each move, and ranks the moves by the best of these averages.
 """
 
 # Import the API objects
@@ -17,38 +17,45 @@ class Bot:
     __num_samples = -1
     # How deep to sample
     __depth = -1
+    # Whether to play the samples all at once (with numpy)
+    __batch = True
 
-    def __init__(self, num_samples=3, depth=8):
+    def __init__(self, num_samples=3, depth=8, batch=True):
         self.__num_samples = num_samples
         self.__depth = depth
+        self.__batch = batch
 
     def get_move(self, state):
 
         # See if we're player 1 or 2
         player = state.whose_turn()
 
-        # Get a list of all legal moves
-        moves = state.moves()
+        # Get all legal moves, with the state each leads to
+        successors = list(state.successors())
 
         # Sometimes many moves have the same, highest score, and we'd like the bot to pick a random one.
         # Shuffling the list of moves ensures that.
-        random.shuffle(moves)
+        random.shuffle(successors)
 
-        best_score = float("-inf")
-        best_move = None
+        moves = [move for move, _ in successors]
+        children = [child for _, child in successors]
 
-        scores = [0.0] * len(moves)
+        n = self.__num_samples
 
-        for move in moves:
-            for s in range(self.__num_samples):
+        if self.__batch:
+            # Evaluate each move num_samples times, with num_samples random games from the state
+            # after the move each time. These games are all played at the same time, in one batch.
+            from api.batch import BatchState # (numpy is only loaded if it's used)
 
-                score = self.evaluate(state.next(move), player)
+            batch = BatchState([child for child in children for _ in range(n * n)])
+            batch.playout(self.__depth, rng=self.rng())
 
-                if score > best_score:
-                    best_score = score
-                    best_move = move
+            # Average the heuristic over the games of each evaluation, and take the best evaluation
+            scores = list(batch.ratio_ships(player).reshape(len(moves), n, n).mean(axis=2).max(axis=1))
+        else:
+            scores = [max(self.evaluate(child, player) for _ in range(n)) for child in children]
 
-        return best_move # Return the best scoring move
+        return moves[scores.index(max(scores))] # Return the best scoring move
 
     def evaluate(self,
                  state,     # type: State
@@ -64,22 +71,34 @@ class Bot:
             state is for the player.
         """
 
-        score = 0.0
+        if self.__batch:
+            # Do some random moves, in num_samples games at once
+            from api.batch import BatchState
 
-        for _ in range(self.__num_samples):
+            batch = BatchState([state] * self.__num_samples)
+            batch.playout(self.__depth, rng=self.rng())
 
-            st = state.clone()
+            return float(batch.ratio_ships(player).mean())
 
-            # Do some random moves
-            for i in range(self.__depth):
-                if st.finished():
-                    break
+        score = 0.0
 
-                st = st.next(random.choice(st.moves()))
+        for _ in range(self.__num_samples):
+            # Do some random moves
+            end = state.playout('random', self.__depth)
 
-            score += util.ratio_ships(state, player)
+            score += util.ratio_ships(end, player)
 
         return score/float(self.__num_samples)
 
+    def rng(self):
+        """
+        :return: A numpy random number generator for the playouts, seeded from the random module.
+            (numpy's own generator isn't reseeded when a process forks, so every copy of the bot in a
+            process pool or a worker process would otherwise play the same random games.)
+        """
+        import numpy as np
+
+        return np.random.RandomState(random.getrandbits(32))
+
     def heuristic(self, state, player):
         return util.ratio_ships(state, player)
\ No newline at end of file
@@ -52,8 +52,11 @@ class Bot:
 
         for move in moves:
 
-            next_state = state.next(move)
-            value, _ = self.value(next_state, alpha, beta, depth = depth + 1, info=info)
+            # Walk the tree with a single state object: make the move, and take it back
+            # after evaluating the resulting state
+            token = state.apply(move)
+            value, _ = self.value(state, alpha, beta, depth = depth + 1, info=info)
+            state.undo(token)
 
             if maximizing(state):
                 if value > best_value:
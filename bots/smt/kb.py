@@ -1,6 +1,5 @@
 import sys
 import numpy as np
-import scipy.optimize as opt
 
 class Symbol(object):
     """
@@ -672,6 +671,8 @@ def optimize(*constraints):
                 raise ValueError(
                     'Unexpected state: the left part of a constraint should not contain constants.')
 
+    # (scipy is only imported when it's first needed, since it takes a long time to load)
+    import scipy.optimize as opt
     result = opt.linprog(c, A_ub, b_ub, A_eq, b_eq, bounds = [(None, None)] * n)
 
     return result
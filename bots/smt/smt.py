@@ -62,8 +62,11 @@ class Bot:
 
         for move in moves:
 
-            next_state = state.next(move)
-            value, _ = self.value(next_state, alpha, beta, depth = depth + 1, info=info)
+            # Walk the tree with a single state object: make the move, and take it back
+            # after evaluating the resulting state
+            token = state.apply(move)
+            value, _ = self.value(state, alpha, beta, depth = depth + 1, info=info)
+            state.undo(token)
 
             if maximizing(state):
                 if value > best_value:
@@ -126,11 +129,4 @@ def count_ships(state, player):
     :return: Counts the number of ships in the game state (in fleets and planets) belonging to the given player.
     '''
 
-    sum = 0
-
-    for planet in state.planets(player):
-        sum += state.garrison(planet)
-    for fleet in state.fleets():
-        if fleet.owner() == player:
-            sum += fleet.size()
-    return sum
+    return state.ships(player)
@@ -8,9 +8,11 @@ of terminal nodes in the game tree where player 1 wins. If this proportion is cl
 
 """
 
-from api import State
-import random
+import matplotlib as mpl
+mpl.use('Agg')
 import matplotlib.pyplot as plt
+from api import State
+from api.batch import BatchState
 
 SAMPLES = 100
 REPEATS = 100
@@ -23,19 +25,11 @@ for r in range(REPEATS):
     # Generate a random start state
     start_state, id = State.generate(num_planets=6)
 
-    # Count how many games are won by player 1
-    won_by_1 = 0
-
-    for i in range(SAMPLES):
-
-        state = start_state.clone()
-
-        while not state.finished():
-            random_move = random.choice(state.moves())
-            state = state.next()
+    # Play SAMPLES random games at once, and count how many are won by player 1
+    batch = BatchState([start_state] * SAMPLES)
+    batch.playout()
 
-        if state.winner() == 1:
-            won_by_1 += 1
+    won_by_1 = (batch.winner() == 1).sum()
 
     result.append( won_by_1/float(SAMPLES) )
 
@@ -0,0 +1,105 @@
+"""
+Check that BatchState plays by the same rules as State.next(): we play random games with both,
+side by side, and compare the owners and garrisons of the planets, the fleets in transit and
+the winner after every plie.
+
+Each batch starts from copies of a state some plies into a game (so that there are fleets in
+transit), and each row plays its own random moves. The batch chooses the moves (so we also check
+that random_moves() only chooses legal moves), and sometimes we replace one by a random pair of
+planets, so that we check moves from planets without ships, and illegal moves, too.
+
+"""
+
+from api import State
+from api.batch import BatchState
+import numpy as np
+import random, sys
+
+GAMES = 100
+
+# The number of rows in each batch, and the number of plies to play in them
+ROWS = 20
+MAX_PLIES = 100
+
+random.seed(0)
+rng = np.random.RandomState(0)
+
+failures = 0
+checks = 0
+
+
+def fleets(state):
+    return sorted((fleet.target().id(), fleet.owner(), fleet.size(), fleet.distance()) for fleet in state.fleets())
+
+
+def batch_fleets(batch, r, state, finished):
+    # A finished row doesn't change anymore, but the batch goes on, so its fleets seem to get closer.
+    # (After an illegal move, the state doesn't move the fleets in that plie either.)
+    if state.revoked() is not None:
+        finished += 1
+
+    return [(target, owner, size, distance + finished) for target, owner, size, distance in batch.fleets(r)]
+
+
+for g in range(GAMES):
+
+    # Generate a start state, and play a few random moves to get some fleets in transit
+    state, id = State.generate(random.randint(2, 15), symmetric=random.choice([True, False]))
+
+    for i in range(random.randint(0, 20)):
+        if state.finished():
+            break
+        state = state.next(random.choice(state.moves()))
+
+    states = [state] * ROWS
+    batch = BatchState(states)
+
+    # For each row, for how many plies its game has been finished
+    finished = [0] * ROWS
+
+    for ply in range(MAX_PLIES + 1):
+        owners = batch.owners()
+        garrisons = batch.garrisons()
+        winners = batch.winner()
+
+        for r, state in enumerate(states):
+            checks += 1
+
+            if list(owners[r]) != [state.owner(p) for p in state.planets()] \
+                    or list(garrisons[r]) != [state.garrison(p) for p in state.planets()] \
+                    or batch_fleets(batch, r, state, finished[r]) != fleets(state) \
+                    or winners[r] != (state.winner() if state.finished() else 0):
+                print('Difference in game {}, row {}, after {} plies! State: {}, batch: {} {} {} winner {}'.format(
+                    g, r, ply, state, list(owners[r]), list(garrisons[r]), batch_fleets(batch, r, state, finished[r]), winners[r]))
+                failures += 1
+
+        if batch.finished().all() or ply == MAX_PLIES:
+            break
+
+        sources, targets = batch.random_moves(rng)
+
+        for r, state in enumerate(states):
+            if state.finished():
+                finished[r] += 1
+                continue
+
+            move = None if sources[r] < 0 else (int(sources[r]), int(targets[r]))
+
+            checks += 1
+            if move not in state.moves():
+                print('Illegal move {} chosen by random_moves() in game {}, row {}! State: {}'.format(move, g, r, state))
+                failures += 1
+
+            n = len(state.planets())
+            if n > 1 and random.random() < 0.02:
+                move = tuple(random.sample(range(n), 2))
+                sources[r], targets[r] = move
+
+            states[r] = state.next(move)
+
+        batch.apply(sources, targets)
+
+print('Done. {} checks, {} differences.'.format(checks, failures))
+
+if failures > 0:
+    sys.exit(1)
@@ -0,0 +1,99 @@
+"""
+Check that the api and the bots can be imported quickly. Every tournament worker and every
+process that plays a game imports them, so they should not load heavy libraries (matplotlib,
+scipy and sklearn) until they are actually used.
+
+Each module is imported in a fresh python process, and we check how long the import takes and
+which of the heavy libraries were loaded. Bots from a worksheet that hasn't been completed yet
+(with ??? in the code) can't be imported: for those, we check that the imports at the top level
+of the file don't mention the heavy libraries.
+
+"""
+
+import os, re, subprocess, sys
+
+MODULES = [
+    'api',
+    'api.engine',
+    'api.util',
+    'bots.rand.rand',
+    'bots.bully.bully',
+    'bots.rdeep.rdeep',
+    'bots.ml.ml',
+    'bots.smt.kb'
+]
+
+HEAVY = ['matplotlib', 'scipy', 'sklearn']
+
+# How long an import may take (in seconds)
+BUDGET = 0.2
+
+# Imports the module, and prints the time it took and the heavy libraries that were loaded
+SCRIPT = """
+import sys, time
+start = time.time()
+import {}
+print(time.time() - start)
+print(' '.join(name for name in {} if name in sys.modules))
+"""
+
+# An import at the top level of a file (not indented, so not inside a function)
+TOP_LEVEL_IMPORT = re.compile(r'^(import|from)\s')
+
+
+def top_level_heavy(module):
+    """
+    The heavy libraries imported at the top level of the file of the given module.
+    """
+    path = os.path.join(*module.split('.')) + '.py'
+
+    heavy = set()
+    with open(path) as f:
+        for line in f:
+            if TOP_LEVEL_IMPORT.match(line):
+                heavy.update(name for name in HEAVY if re.search(r'\b{}\b'.format(name), line))
+
+    return sorted(heavy)
+
+
+failed = False
+
+for module in MODULES:
+    process = subprocess.Popen([sys.executable, '-c', SCRIPT.format(module, HEAVY)],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, error = process.communicate()
+
+    if process.returncode != 0:
+        error = error.decode()
+
+        # Some bots can only be imported once the worksheet has been completed
+        if 'SyntaxError' in error and '???' in error:
+            heavy = top_level_heavy(module)
+            if len(heavy) > 0:
+                print('{}: imports {} at the top level'.format(module, ' '.join(heavy)))
+                failed = True
+            else:
+                print('{}: worksheet not completed, only checked the top level imports'.format(module))
+            continue
+
+        print('{}: could not be imported:\n{}'.format(module, error))
+        failed = True
+        continue
+
+    seconds, loaded = output.decode().split('\n')[:2]
+    seconds = float(seconds)
+
+    if loaded != '':
+        print('{}: loads {}'.format(module, loaded))
+        failed = True
+    elif seconds > BUDGET:
+        print('{}: import took {:.3f}s (budget {}s)'.format(module, seconds, BUDGET))
+        failed = True
+    else:
+        print('{}: {:.3f}s'.format(module, seconds))
+
+if failed:
+    print('Some imports failed or are too slow.')
+    sys.exit(1)
+
+print('Done. All imports within budget.')
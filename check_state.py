@@ -0,0 +1,147 @@
+"""
+Check that the shortcuts in State give the same states as playing the game with next(), one
+plie at a time:
+
+ * successors() should give the same moves, and the same states, as next() for each move.
+ * advance_until_event() should give the same state as the same number of next(None) calls.
+ * projection() should give the owners and garrisons of the states after repeated next(None).
+ * apply() should give the same state as next(), and undo() the state from before.
+
+The states are compared on their encoding, hash, ship and planet counts, the planets of each
+player and their legal moves. Some games have illegal moves, so we check revoked states too.
+Sometimes we compute the hash of a state before changing it (so it's kept up to date), and
+sometimes we don't.
+
+"""
+
+from api import State
+import random, sys
+
+GAMES = 60
+
+# Stop each game after this many turns (the shortcuts matter most early on, with many fleets in transit)
+MAX_TURNS = 50
+
+random.seed(0)
+
+failures = 0
+checks = 0
+
+
+def summary(state):
+    return (state.to_bytes(),
+            hash(state),
+            repr(state),
+            state.turn_nr(),
+            state.whose_turn(),
+            state.revoked(),
+            state.finished(),
+            state.winner(),
+            [state.ships(p) for p in (0, 1, 2)],
+            [state.planet_count(p) for p in (0, 1, 2)],
+            [state.planets(p) for p in (0, 1, 2)],
+            [] if state.finished() else state.moves())
+
+
+def check(what, state, expected, found):
+    global failures, checks
+    checks += 1
+
+    if summary(expected) != summary(found):
+        print('Difference in {}! State: {}, expected: {}, found: {}'.format(what, state, expected, found))
+        failures += 1
+
+
+def random_move(state):
+    # Sometimes play an illegal move, so we check revoked states too
+    if random.random() < 0.02:
+        opponents = state.planets(1 if state.whose_turn() == 2 else 2)
+        if len(opponents) > 0:
+            return opponents[0].id(), state.planets()[0].id()
+
+    return random.choice(state.moves())
+
+
+for g in range(GAMES):
+
+    # Generate a start state
+    state, id = State.generate(random.randint(2, 12), symmetric=random.choice([True, False]))
+
+    while not state.finished() and state.turn_nr() < MAX_TURNS:
+
+        if random.random() < 0.5:
+            hash(state)
+
+        # successors() against next()
+        for encoded in (False, True):
+            successors = list(state.successors(encoded))
+            moves = state.moves(encoded)
+
+            checks += 1
+            if [move for move, _ in successors] != moves:
+                print('Difference in the moves of successors()! State: {}'.format(state))
+                failures += 1
+
+            for move, successor in successors:
+                check('successors() for move {}'.format(move), state, state.next(move), successor)
+
+        # advance_until_event() against next(None)
+        max_plies = random.choice([None, 1, 3, 10])
+
+        advanced = state.clone()
+        plies = advanced.advance_until_event(max_plies)
+
+        expected = state
+        for i in range(plies):
+            expected = expected.next(None)
+
+        check('advance_until_event({})'.format(max_plies), state, expected, advanced)
+
+        # projection() against next(None)
+        owners, garrisons = state.projection()
+
+        expected = state
+        for k in range(len(owners)):
+            checks += 1
+            if list(owners[k]) != [expected.owner(p) for p in expected.planets()] \
+                    or list(garrisons[k]) != [expected.garrison(p) for p in expected.planets()]:
+                print('Difference in projection() after {} plies! State: {}, expected: {}'.format(k, state, expected))
+                failures += 1
+                break
+
+            if expected.finished():
+                break
+            expected = expected.next(None)
+
+        # apply() against next(), for a few moves, and then undo() them all
+        walker = state.clone()
+        expected = state
+        tokens = []
+
+        for depth in range(3):
+            if walker.finished():
+                break
+
+            move = random_move(walker)
+            tokens.append(walker.apply(move))
+
+            expected = expected.next(move)
+            check('apply({})'.format(move), state, expected, walker)
+
+            # (the projection is kept with the state, so it has to be recomputed after apply())
+            checks += 1
+            if walker.projection() != expected.projection():
+                print('Difference in projection() after apply({})! State: {}'.format(move, state))
+                failures += 1
+
+        for token in reversed(tokens):
+            walker.undo(token)
+
+        check('undo()', state, state, walker)
+
+        state = state.next(random_move(state))
+
+print('Done. {} checks, {} differences.'.format(checks, failures))
+
+if failures > 0:
+    sys.exit(1)
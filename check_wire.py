@@ -0,0 +1,62 @@
+"""
+Check that states survive the binary encoding used to send them to bot processes: decoding
+state.to_bytes() should give back the same state, with the same fleets, hash and legal moves.
+
+We also compare the size of the encoding to that of a pickled state.
+
+"""
+
+from api import State
+import random, pickle, sys
+
+GAMES = 100
+
+random.seed(0)
+
+failures = 0
+states = 0
+wire_size = 0
+pickle_size = 0
+
+for g in range(GAMES):
+
+    # Generate a start state
+    state, id = State.generate(random.randint(2, 20), symmetric=random.choice([True, False]))
+
+    while True:
+        copy = State.from_bytes(state.map(), state.to_bytes())
+        states += 1
+
+        if copy != state \
+                or hash(copy) != hash(state) \
+                or repr(copy) != repr(state) \
+                or copy.finished() != state.finished() \
+                or copy.winner() != state.winner() \
+                or [copy.ships(p) for p in (0, 1, 2)] != [state.ships(p) for p in (0, 1, 2)] \
+                or (not state.finished() and copy.moves() != state.moves()):
+            print('Difference! Original: {}, decoded: {}'.format(state, copy))
+            failures += 1
+
+        wire_size += len(state.to_bytes())
+        pickle_size += len(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+        if state.finished():
+            break
+
+        # Sometimes play an illegal move, so we check revoked states too
+        if random.random() < 0.01:
+            opponents = state.planets(1 if state.whose_turn() == 2 else 2)
+            if len(opponents) > 0:
+                state = state.next((opponents[0].id(), state.planets()[0].id()))
+                continue
+
+        state = state.next(random.choice(state.moves()))
+
+        # The decoded state should play on in the same way
+        state = State.from_bytes(state.map(), state.to_bytes())
+
+print('Done. {} states checked, {} differences.'.format(states, failures))
+print('Average size: {:.0f} bytes encoded, {:.0f} bytes pickled.'.format(wire_size / float(states), pickle_size / float(states)))
+
+if failures > 0:
+    sys.exit(1)
@@ -0,0 +1,50 @@
+#!usr/bin/env python
+"""
+A command line program for making a map catalog: a file of start states that tournaments
+can read their maps from (see api/catalog.py).
+
+For all the options run
+python make-catalog.py -h
+"""
+
+from argparse import ArgumentParser
+
+from api import State, catalog
+
+
+if __name__ == "__main__":
+
+    ## Parse the command line options
+    parser = ArgumentParser()
+
+    parser.add_argument("outfile",
+                        help="The catalog file to write (for instance maps.cat)")
+
+    parser.add_argument("-p", "--num-planets",
+                        dest="planets",
+                        help="The map sizes to generate maps for",
+                        type=int, nargs='*', default=[6])
+
+    parser.add_argument("-n", "--num-maps",
+                        dest="num_maps",
+                        help="How many maps to generate for each size (with ids 0 to n-1)",
+                        type=int, default=1000)
+
+    parser.add_argument("-a", "--asym", dest="asym",
+                        help="Generate asymmetric maps",
+                        action="store_true")
+
+    parser.add_argument("-f", "--from", dest="source",
+                        help="Don't generate maps, but take them from this file (in the format of State.load(): "
+                             "several maps, separated by empty lines). They are numbered from 0, in order.",
+                        default=None)
+
+    options = parser.parse_args()
+
+    if options.source is None:
+        catalog.build(options.outfile, sizes=options.planets, ids=range(options.num_maps), symmetric=not options.asym)
+    else:
+        states = State.load_all(options.source)
+        catalog.build(options.outfile, symmetric=not options.asym, states=list(enumerate(states)))
+
+    print('Done. {} maps in {}.'.format(len(catalog.MapCatalog(options.outfile)), options.outfile))
@@ -1,12 +1,24 @@
 import argparse
+import binascii
+import hashlib
 import multiprocessing
 import multiprocessing.pool
+import multiprocessing.connection
+import os
+import Queue
+import socket
 import sys
+import threading
+import traceback
 
 import itertools
+import math
 import random
 
 from api import State, util, engine
+from api.stats import SPRT, Elo
+from api.results import ResultCache
+from api.catalog import MapCatalog
 
 BLACK, RED, GREEN, YELLOW, BLUE, MAGENTA, CYAN, WHITE = range(8)
 colors = {
@@ -18,45 +30,151 @@ colors = {
 
 args = None
 
+# The bots, in the order of args.players. In process mode, each process in the pool loads its own.
+bots = None
+
+# The map catalog (with --catalog). Each process opens it, and they share its memory.
+catalog = None
+
 NOTIFY_AMOUNT = 5
 
 def main():
+    global bots, catalog
 
-    pool = multiprocessing.pool.ThreadPool(args.parallelism)
+    # (loading the bots here also checks that they can be loaded, before we start the pool)
+    bots = [util.load_player(botname) for botname in args.players]
 
-    bots = []
-    for id, botname in enumerate(args.players):
-        bots.append((id, util.load_player(botname)))
+    if args.catalog is not None:
+        catalog = MapCatalog(args.catalog)
+
+    if args.serve is not None:
+        # Each game is played by a worker (started with --worker), possibly on another machine
+        # (the connections carry pickles, so anyone who has the key can run code on the other side)
+        if args.authkey is None:
+            args.authkey = binascii.hexlify(os.urandom(16))
+
+        pool = Coordinator(parse_address(args.serve), args.authkey)
+        log("Waiting for workers on {} (start them with --worker {} --authkey {})".format(args.serve, args.serve, args.authkey))
+    elif args.threads:
+        # Each game runs in a thread, with the bots in separate processes
+        pool = multiprocessing.pool.ThreadPool(args.parallelism)
+    else:
+        # Each game runs in a process in the pool, and the bots are called directly (in that process)
+        pool = multiprocessing.Pool(args.parallelism, initializer=init_worker, initargs=(args, ))
 
     wins = [0] * len(bots)
 
-    games = list(itertools.combinations(bots, 2))
-    random.shuffle(games)
+    # Ratings for all bots, updated after every round
+    elo = Elo(len(bots))
+
+    if args.league:
+        # The games are scheduled one league round at a time, depending on the ratings
+        games = []
+
+        league_rounds = args.league_rounds
+        if league_rounds is None:
+            league_rounds = 2 * int(math.ceil(math.log(len(bots), 2)))
 
-    matches = len(games)*args.matches*len(args.planets)
-    rounds = matches * args.rounds
+        matches = league_rounds * (len(bots) // 2) * len(args.planets)
+        rounds = matches * args.rounds
 
-    log("{} Bots, {} Maps, {} Games, {} Matches, {} Rounds, 1 victor".format(len(bots), len(args.planets),
-                                                                             len(games), matches, rounds))
+        log("{} Bots, {} Maps, {} League rounds, {} Matches, {} Rounds".format(len(bots), len(args.planets),
+                                                                             league_rounds, matches, rounds))
+    else:
+        games = list(itertools.combinations(range(len(bots)), 2))
+        random.shuffle(games)
+
+        matches = len(games)*args.matches*len(args.planets)
+        rounds = matches * args.rounds
+
+        log("{} Bots, {} Maps, {} Games, {} Matches, {} Rounds, 1 victor".format(len(bots), len(args.planets),
+                                                                                 len(games), matches, rounds))
 
     scores = lambda: sorted(zip(wins, args.players), key=lambda x: x[0], reverse=True)
 
-    try:
+    # A sequential test for each game, to see if we can stop early (with --sprt)
+    tests = [SPRT(delta=args.delta) for _ in games]
+
+    def waves():
+        """
+        The rounds to play: all at once, or with --sprt, a few matches at a time for each game
+        that hasn't been decided yet (enough to keep the pool busy). In a league, one league
+        round at a time, paired by the ratings after the previous round.
+        """
+        if args.league:
+            played = set()
+
+            for r in range(league_rounds):
+                pairs = elo.pairings(played)
+                played.update(frozenset(pair) for pair in pairs)
+
+                gids = range(len(games), len(games) + len(pairs))
+                games.extend(pairs)
+                tests.extend(SPRT(delta=args.delta) for _ in pairs)
+
+                log("League round {}/{}: {}".format(r + 1, league_rounds,
+                    ", ".join("{} vs {}".format(args.players[a], args.players[b]) for a, b in pairs)), lvl=1)
+
+                # (each league round is a different match, so that it's played on different maps)
+                yield gen_rounds(zip(gids, pairs), [r])
+            return
+
+        if not args.sprt:
+            yield gen_rounds(list(enumerate(games)), range(args.matches))
+            return
+
         i = 0
-        for ret in pool.imap_unordered(execute, gen_rounds(games)):
-            i += 1
-            (gid, mid, rid), winner, (pid1, pid2), (map_size, seed) = ret
-            if winner is None:
-                result = "DRAW"
-            else:
-                result = args.players[winner]
-                wins[winner] += 1
+        while i < args.matches:
+            undecided = [(gid, game) for gid, game in enumerate(games) if tests[gid].decided() is None]
+            if len(undecided) == 0:
+                return
+
+            # With few games left, play more of their matches at once, so that the pool is not idle
+            wave_rounds = len(undecided) * len(args.planets) * args.rounds
+            count = min(args.matches - i, max(1, int(math.ceil(float(args.parallelism) / wave_rounds))))
+
+            yield gen_rounds(undecided, range(i, i + count))
+            i += count
 
-            log("({}:{}:{} | {}:{} | {}:{}): {}".format(gid, mid, rid, map_size, seed, pid1, pid2, result), lvl=2)
+    # With --cache, we only play the rounds we haven't played before (with the same bots)
+    cache = None if args.cache is None else ResultCache(args.cache)
+    reused = 0
 
-            if i % NOTIFY_AMOUNT == 0:
-                log("Finished {}/{} rounds ({:.2f})%. Current top 3: {}".format(i, rounds, (float(i) / rounds * 100),
-                                                                                scores()[:3]))
+    try:
+        played = 0
+        for wave in waves():
+            wave = list(wave)
+            known = []
+
+            if cache is not None:
+                known = [cached(cache, params) for params in wave if cache_key(cache, *params) in cache]
+                wave = [params for params in wave if cache_key(cache, *params) not in cache]
+                reused += len(known)
+
+            # The results come back as soon as each game is finished
+            results = pool.imap_unordered(execute, wave, chunksize=args.chunk_size)
+            if cache is not None:
+                results = store(cache, results)
+
+            for ret in itertools.chain(known, results):
+                played += 1
+                (gid, mid, rid), winner, (pid1, pid2), (map_size, seed) = ret
+                if winner is None:
+                    result = "DRAW"
+                else:
+                    result = args.players[winner]
+                    wins[winner] += 1
+
+                # (once a test is decided, the rest of its wave doesn't change the decision)
+                if tests[gid].decided() is None:
+                    tests[gid].add(None if winner is None else (1 if winner == games[gid][0] else 2))
+                elo.add(pid1, pid2, winner)
+
+                log("({}:{}:{} | {}:{} | {}:{}): {}".format(gid, mid, rid, map_size, seed, pid1, pid2, result), lvl=2)
+
+                if played % NOTIFY_AMOUNT == 0:
+                    log("Finished {}/{} rounds ({:.2f})%. Current top 3: {}".format(played, rounds, (float(played) / rounds * 100),
+                                                                                    scores()[:3]))
     except KeyboardInterrupt:
         log("Tournament interrupted by user", type="FAIL")
         pool.terminate()
@@ -67,31 +185,264 @@ def main():
     pool.join()
 
     log("All games finished", type="SUCCESS")
-    for i, (wins, bot) in enumerate(scores()):
-        log("{:3}. {:20} ({})".format(i, bot, wins))
+    if args.league:
+        for i, bot in enumerate(elo.ranking()):
+            log("{:3}. {:20} ({:.0f}, {} wins in {} rounds)".format(i, args.players[bot], elo.rating(bot),
+                                                                   wins[bot], elo.games(bot)))
+    else:
+        for i, (wins, bot) in enumerate(scores()):
+            log("{:3}. {:20} ({})".format(i, bot, wins))
+
+    if cache is not None:
+        log("Reused {} of {} rounds from {}".format(reused, played, args.cache))
+
+    if args.sprt:
+        log("Played {} of at most {} rounds".format(played, rounds))
+
+        for (p1, p2), test in zip(games, tests):
+            if test.decided() is None:
+                verdict = "undecided"
+            else:
+                verdict = "{} is better".format(args.players[p1] if test.decided() == 1 else args.players[p2])
 
+            log("{} vs {}: {}-{} in {} rounds, {} (confidence {:.3f})".format(
+                args.players[p1], args.players[p2], test.wins(1), test.wins(2), test.games(), verdict, test.confidence()))
 
-def gen_rounds(games):
-    for gid, game in enumerate(games):
+
+def gen_rounds(games, match_ids):
+    for gid, game in games:
         for map_id, map_size in enumerate(args.planets):
-            for i in range(args.matches):
+            for i in match_ids:
                 mid = map_id * args.matches + i
-                seed = random.randint(0, 100000)
+                seed = random.randint(0, 100000) if args.seed is None else map_seed(map_size, i)
+
+                # Play the maps in the catalog (if it has maps of this size)
+                if catalog is not None and len(catalog.ids(map_size)) > 0:
+                    ids = catalog.ids(map_size)
+                    seed = ids[seed % len(ids)]
+
                 for j in range(args.rounds):
                     players = (game[0], game[1]) if j % 2 == 0 else (game[1], game[0])
                     yield ((gid, mid, j), players, (map_size, seed))
 
 
+class Coordinator(object):
+    """
+    Hands out rounds to workers (see work()) that connect over a socket, and collects their results.
+    It can be used in place of the pool: it has the same imap_unordered(), close(), join() and terminate().
+
+    Each worker plays one round at a time. If a worker disconnects (or takes much longer than a round
+    can), its round is given to another worker. Workers can connect (and leave) at any time.
+    """
+
+    def __init__(self, address, authkey):
+        self.__listener = multiprocessing.connection.Listener(address, authkey=authkey)
+
+        # The rounds waiting for a worker, and the results that came back: (True, result) or (False, error)
+        self.__jobs = Queue.Queue()
+        self.__results = Queue.Queue()
+
+        self.__closed = False
+        self.__threads = []
+
+        # A round can take at most this long (two moves per turn, plus time to start up)
+        self.__timeout = args.max_turns * 2 * args.max_time + 60
+
+        accept = threading.Thread(target=self.__accept)
+        accept.daemon = True
+        accept.start()
+
+    def imap_unordered(self, func, iterable, chunksize=1):
+        """
+        Have the workers play the given rounds, and yield the results as they come in. (The workers
+        always call execute(), so func is ignored. So is chunksize: each worker plays one round at a time.)
+        """
+        count = 0
+        for params in iterable:
+            self.__jobs.put(params)
+            count += 1
+
+        for _ in range(count):
+            # (with a timeout, so that the main thread can still be interrupted)
+            while True:
+                try:
+                    ok, result = self.__results.get(timeout=1)
+                    break
+                except Queue.Empty:
+                    pass
+
+            if not ok:
+                raise RuntimeError("A worker failed to play a round:\n" + result)
+
+            yield result
+
+    def close(self):
+        self.__closed = True
+
+    def terminate(self):
+        self.__closed = True
+
+    def join(self):
+        for thread in list(self.__threads):
+            thread.join()
+
+        self.__listener.close()
+
+    def __accept(self):
+        while not self.__closed:
+            try:
+                conn = self.__listener.accept()
+            except Exception as e:
+                if self.__closed:
+                    return
+                log("A worker could not connect: {}".format(e), type="WARN")
+                continue
+
+            thread = threading.Thread(target=self.__serve, args=(conn, ))
+            thread.daemon = True
+            self.__threads.append(thread)
+            thread.start()
+
+    def __serve(self, conn):
+        """
+        Talk to one worker, until it disconnects or the tournament is over.
+        """
+        try:
+            name = conn.recv()
+            conn.send(args)
+            log("Worker {} connected".format(name), lvl=1)
+
+            while not self.__closed:
+                try:
+                    job = self.__jobs.get(timeout=1)
+                except Queue.Empty:
+                    continue
+
+                try:
+                    conn.send(job)
+                    if not conn.poll(self.__timeout):
+                        raise IOError("no result after {:.0f} seconds".format(self.__timeout))
+
+                    self.__results.put(conn.recv())
+                except (IOError, EOFError, OSError) as e:
+                    # Someone else should play this round
+                    self.__jobs.put(job)
+                    log("Lost worker {} ({}), its round will be played again".format(name, str(e) or "disconnected"), type="WARN")
+                    return
+
+            conn.send(None)
+        except (IOError, EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+
+def work(address):
+    """
+    Play rounds for a coordinator (started with --serve), until it says the tournament is over.
+    """
+    conn = multiprocessing.connection.Client(address, authkey=args.authkey)
+    conn.send("{}:{}".format(socket.gethostname(), multiprocessing.current_process().pid))
+
+    # Play with the settings (and bots) of the tournament
+    init_worker(conn.recv())
+
+    while True:
+        try:
+            params = conn.recv()
+        except EOFError:
+            break
+
+        if params is None:
+            break
+
+        try:
+            conn.send((True, execute(params)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+    conn.close()
+
+
+def parse_address(address):
+    """
+    host:port for TCP, anything else is the path of a Unix socket.
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def map_seed(map_size, match_id):
+    """
+    The seed of a map when --seed is given: every pair of bots plays the same maps, and so
+    does every run of the tournament (which lets us reuse cached results). The match id is the
+    match of a game, or in a league, the league round.
+    """
+    digest = hashlib.sha1("{}:{}:{}".format(args.seed, map_size, match_id).encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % 100001
+
+
+def cache_key(cache, ids, players, map):
+    (gid, mid, rid), (player1, player2), (map_size, seed) = ids, players, map
+
+    # With a catalog, the seed is the id of a map in it, so the key needs to say which catalog
+    maps = None
+    if catalog is not None and len(catalog.ids(map_size)) > 0:
+        maps = catalog.digest()
+
+    # (the round, so that the rounds with the same seats are different games rather than one game reused)
+    return cache.key(bots[player1], bots[player2], map_size, seed, max_turns=args.max_turns,
+                     symmetric=not args.asym, maps=maps, round=rid, max_time=args.max_time)
+
+
+def cached(cache, params):
+    """
+    The result of a round, from the cache (in the same form as the result of execute()).
+    """
+    ids, (player1, player2), (map_size, seed) = params
+    seat = cache.get(cache_key(cache, ids, (player1, player2), (map_size, seed)))
+
+    winner = None if seat is None else (player1, player2)[seat-1]
+    return ids, winner, (player1, player2), (map_size, seed)
+
+
+def store(cache, results):
+    """
+    Add the results of execute() to the cache as they come in (and pass them on).
+    """
+    for ret in results:
+        ids, winner, (player1, player2), (map_size, seed) = ret
+        seat = None if winner is None else (1 if winner == player1 else 2)
+
+        cache.put(cache_key(cache, ids, (player1, player2), (map_size, seed)), seat)
+        yield ret
+
+
+def init_worker(arguments):
+    """
+    Set up a process in the pool: load the bots once, for all the games this process plays.
+    """
+    global args, bots, catalog
+
+    args = arguments
+    bots = [util.load_player(botname) for botname in args.players]
+
+    if args.catalog is not None:
+        catalog = MapCatalog(args.catalog)
+
+
 def execute(params):
     ids, (player1, player2), (map_size, seed) = params
-    start, _ = State.generate(map_size, seed, symmetric=not args.asym)
+    start, _ = State.generate(map_size, seed, symmetric=not args.asym, catalog=catalog)
 
-    winner = engine.play(player1[1], player2[1], start, verbose=(args.verbose > 2), outfile=None,
-                         max_time=args.max_time * 1000, max_turns=args.max_turns)
+    winner = engine.play(bots[player1], bots[player2], start, verbose=(args.verbose > 2),
+                         max_time=args.max_time * 1000, max_turns=args.max_turns, outfile=None, isolate=args.threads)
 
     if winner is not None:
-        winner = (player1[0], player2[0])[winner-1]
-    return ids, winner, (player1[0], player2[0]), (map_size, seed)
+        winner = (player1, player2)[winner-1]
+    return ids, winner, (player1, player2), (map_size, seed)
 
 
 # following from Python cookbook, #475186
@@ -173,6 +524,75 @@ def optparse():
                         help="Pool size for parallelism. Do not use unless you know what you are doing",
                         type=int, default=multiprocessing.cpu_count())
 
+    parser.add_argument("--chunk-size",
+                        dest="chunk_size",
+                        help="How many games to send to a process in the pool at a time",
+                        type=int, default=4)
+
+    parser.add_argument("-s", "--sprt", dest="sprt",
+                        help="Stop playing a pair of bots once a sequential test (SPRT) shows which is better. "
+                             "The number of matches is then the maximum.",
+                        action="store_true")
+
+    parser.add_argument("--delta",
+                        dest="delta",
+                        help="For --sprt: how much more than half of the rounds a bot should win to count as better",
+                        type=float, default=0.1)
+
+    parser.add_argument("-l", "--league", dest="league",
+                        help="Play a Swiss-style league instead of every pair of bots: in each league round, "
+                             "bots play the bot nearest to them in the Elo ranking. For many bots.",
+                        action="store_true")
+
+    parser.add_argument("--league-rounds",
+                        dest="league_rounds",
+                        help="For --league: how many league rounds to play (each bot plays one match per map "
+                             "size per league round). By default, 2*log2 of the number of bots.",
+                        type=int, default=None)
+
+    parser.add_argument("--cache",
+                        dest="cache",
+                        help="A file of results (JSON lines) to reuse: rounds that were played before, by the same "
+                             "bots (same source code and parameters) on the same map, are not played again. "
+                             "New results are added to the file. Implies --seed 0, unless another seed is given.",
+                        default=None)
+
+    parser.add_argument("--seed",
+                        dest="seed",
+                        help="Generate the maps from this seed, so that every run of the tournament plays the "
+                             "same maps. By default, the maps are random.",
+                        type=int, default=None)
+
+    parser.add_argument("--serve",
+                        dest="serve",
+                        help="Don't play the rounds here, but hand them out to workers (see --worker) that connect "
+                             "to this address: host:port, or the path of a Unix socket.",
+                        default=None)
+
+    parser.add_argument("--worker",
+                        dest="worker",
+                        help="Play rounds for the tournament served (with --serve) at this address. Start as many "
+                             "workers as you like, on any machine that has the bots. The other options are ignored.",
+                        default=None)
+
+    parser.add_argument("--authkey",
+                        dest="authkey",
+                        help="For --serve and --worker: the password workers need to connect. Required for "
+                             "--worker. With --serve, a random one is made (and shown) if none is given.",
+                        default=None)
+
+    parser.add_argument("--catalog",
+                        dest="catalog",
+                        help="A map catalog (see make-catalog.py) to take the maps from, for the map sizes it has. "
+                             "With --worker, each worker needs the file at the same path.",
+                        default=None)
+
+    parser.add_argument("--threads",
+                        dest="threads",
+                        help="Play the games in threads, with each bot in a separate process (slower, "
+                             "but a bot that takes too long is stopped)",
+                        action="store_true")
+
     parser.add_argument("-v", "--verbose",
                         action="count", default=0,
                         help="Show more output")
@@ -185,7 +605,20 @@ def optparse():
 
     args = parser.parse_args()
 
+    if args.league and args.sprt:
+        parser.error("--league and --sprt can't be used together")
+
+    if args.worker is not None and args.authkey is None:
+        parser.error("--worker needs the --authkey of the tournament")
+
+    if args.cache is not None and args.seed is None:
+        args.seed = 0
+
 
 if __name__ == "__main__":
     optparse()
-    main()
+
+    if args.worker is not None:
+        work(parse_address(args.worker))
+    else:
+        main()
@@ -27,13 +27,19 @@ def call_engine(options):
         print('-- Using map with id {} '.format(id))
         print('   Start state: ' + str(state))
 
-    # Play the game
-    viz = (options.outputfile.lower() == 'none')
-    outfile = options.outputfile # type: str
-    if not outfile.endswith('.pdf'):
-        outfile += '.pdf'
+    # Play the game, writing a replay next to the pdf (which is made from it after the game)
+    outfile = None
+    replayfile = None
 
-    engine.play(player1, player2, state=state, max_time=options.max_time*1000, verbose=(not options.quiet), outfile=outfile)
+    if options.outputfile.lower() != 'none':
+        outfile = options.outputfile # type: str
+        if not outfile.endswith('.pdf'):
+            outfile += '.pdf'
+
+        replayfile = outfile[:-len('.pdf')] + '.replay'
+
+    engine.play(player1, player2, state=state, max_time=options.max_time*1000, verbose=(not options.quiet),
+                outfile=outfile, replay=replayfile)
 
 if __name__ == "__main__":
 
@@ -65,7 +71,7 @@ if __name__ == "__main__":
                         action="store_true")
 
     parser.add_argument("--output", dest="outputfile",
-                        help="Where to store the visualization of the game (a pdf file). Set to 'none' for no output.",
+                        help="Where to store the visualization of the game (a pdf file). A replay of the game is stored next to it. Set to 'none' for no output.",
                         default="game.pdf")
 
     parser.add_argument("-a", "--asym", dest="asym",
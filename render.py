@@ -0,0 +1,32 @@
+#!usr/bin/env python
+"""
+A command line program for visualizing a game from its replay (as written by play.py).
+
+For all the options run
+python render.py -h
+"""
+
+from argparse import ArgumentParser
+
+from api import replay
+
+
+if __name__ == "__main__":
+
+    ## Parse the command line options
+    parser = ArgumentParser()
+
+    parser.add_argument("replay",
+                        help="The replay of the game (for instance game.replay)")
+
+    parser.add_argument("--output", dest="outputfile",
+                        help="Where to store the visualization of the game (a pdf file). By default, the name of the replay with the extension .pdf.",
+                        default=None)
+
+    options = parser.parse_args()
+
+    outfile = options.outputfile
+    if outfile is None:
+        outfile = options.replay.rsplit('.', 1)[0] + '.pdf'
+
+    replay.render(options.replay, outfile)
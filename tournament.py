@@ -8,15 +8,17 @@ python play.py -h
 
 from argparse import ArgumentParser
 from api import State, util, engine
+from api.stats import SPRT
 import random
 
 def run_tournament(options):
 
     botnames = options.players.split(",")
 
+    # Each bot runs in its own process, for the whole tournament
     bots = []
     for botname in botnames:
-        bots.append(util.load_player(botname))
+        bots.append(engine.Worker(util.load_player(botname)))
 
     n = len(bots)
     wins = [0] * len(bots)
@@ -25,10 +27,22 @@ def run_tournament(options):
     totalgames = (n*n - n)/2 * options.repeats
     playedgames = 0
 
-    print('Playing {} games:'.format(totalgames))
+    # With --sprt, we stop playing a pair of bots as soon as it's clear which one is better
+    tests = {}
+
+    if options.sprt:
+        print('Playing at most {} games:'.format(totalgames))
+    else:
+        print('Playing {} games:'.format(totalgames))
+
     for a, b in matches:
+        test = tests[(a, b)] = SPRT(delta=options.delta)
+
         for r in range(options.repeats):
 
+            if options.sprt and test.decided() is not None:
+                break
+
             if random.choice([True, False]):
                 p = [a, b]
             else:
@@ -42,13 +56,31 @@ def run_tournament(options):
                 winner = p[winner - 1]
                 wins[winner] += 1
 
+            test.add(None if winner is None else (1 if winner == a else 2))
+
             playedgames += 1
             print('Played {} out of {:.0f} games ({:.0f}%): {} \r'.format(playedgames, totalgames, playedgames/float(totalgames) * 100, wins))
 
+    for bot in bots:
+        bot.stop()
+
     print('Results:')
     for i in range(len(bots)):
         print('    bot {}: {} wins'.format(bots[i], wins[i]))
 
+    if options.sprt:
+        print('Matches:')
+        for a, b in matches:
+            test = tests[(a, b)]
+
+            if test.decided() is None:
+                verdict = 'undecided'
+            else:
+                verdict = '{} is better'.format(botnames[a] if test.decided() == 1 else botnames[b])
+
+            print('    {} vs {}: {}-{} in {} games, {} (confidence {:.3f})'.format(
+                botnames[a], botnames[b], test.wins(1), test.wins(2), test.games(), verdict, test.confidence()))
+
 
 if __name__ == "__main__":
 
@@ -70,6 +102,16 @@ if __name__ == "__main__":
                         help="How many matches to play for each pair of bots",
                         type=int, default=10)
 
+    parser.add_argument("-s", "--sprt", dest="sprt",
+                        help="Stop playing a pair of bots once a sequential test (SPRT) shows which is better. "
+                             "The number of repeats is then the maximum.",
+                        action="store_true")
+
+    parser.add_argument("--delta",
+                        dest="delta",
+                        help="For --sprt: how much more than half of the games a bot should win to count as better",
+                        type=float, default=0.1)
+
     parser.add_argument("-t", "--max-time",
                         dest="max_time",
                         help="maximum amount of time allowed per turn in seconds (default: 5)",